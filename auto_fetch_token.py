@@ -1,9 +1,16 @@
 import os
 import json
+import threading
 import webbrowser
 import requests
 from flask import Flask, request
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, falls back to res.json()
+    orjson = None
 
 load_dotenv()
 
@@ -17,8 +24,13 @@ AUTH_URL = (
 )
 TOKEN_URL = "https://api.upstox.com/v2/login/authorization/token"
 
+# Reused HTTP session (keeps the TLS connection across retries)
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
 app = Flask(__name__)
 auth_code = None
+auth_ready = threading.Event()
 
 
 def update_env_token(token):
@@ -39,6 +51,7 @@ def update_env_token(token):
 def capture_token_root():
     global auth_code
     auth_code = request.args.get("code")
+    auth_ready.set()
     return "Authentication Successful. You may close this window now."
 
 
@@ -51,12 +64,12 @@ def exchange_code_for_token(code):
         "grant_type": "authorization_code",
     }
 
-    res = requests.post(TOKEN_URL, data=payload)
+    res = _session.post(TOKEN_URL, data=payload, timeout=10)
 
     if res.status_code != 200:
         raise Exception(f"Token Exchange Failed: {res.text}")
 
-    data = res.json()
+    data = orjson.loads(res.content) if orjson is not None else res.json()
     access_token = data.get("access_token")
 
     update_env_token(access_token)
@@ -69,7 +82,6 @@ def get_token():
     global auth_code
 
     # Start Flask server
-    import threading
     server = threading.Thread(
         target=lambda: app.run(port=80, debug=False, use_reloader=False)
     )
@@ -81,8 +93,8 @@ def get_token():
     webbrowser.open(AUTH_URL)
 
     print("Waiting for login... OTP + Allow + Redirect...")
-    while auth_code is None:
-        pass
+    if not auth_ready.wait(timeout=300) or auth_code is None:
+        raise Exception("Login timed out: no auth code received")
 
     print("Auth code received. Exchanging for token...")
     print("Auth Code:", auth_code)
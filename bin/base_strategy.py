@@ -1,6 +1,24 @@
 import pandas as pd
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the loop just runs as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+try:
+    import bottleneck as bn
+except ImportError:  # bottleneck is optional, pandas rolling is the fallback
+    bn = None
+
+try:
+    import polars as pl
+except ImportError:  # polars is optional, only needed for engine="polars"
+    pl = None
+
 # ============================================================
 # Required Columns in DF:
 # df = pd.DataFrame({
@@ -9,6 +27,17 @@ import numpy as np
 # timestamp must be pandas datetime
 # ============================================================
 
+TRADE_COLUMNS = ["entry_time", "exit_time", "entry_price", "exit_price", "side", "reason"]
+
+# Codes returned by the execution loop
+SIDE_NAMES = np.array(["LONG", "SHORT"], dtype=object)
+REASON_NAMES = np.array(["Forced Square-Off", "SL Hit", "TP Hit"], dtype=object)
+LONG, SHORT = 0, 1
+SQUARE_OFF, SL_HIT, TP_HIT = 0, 1, 2
+
+# Lunch window, minutes of day (12:00 - 13:30)
+LUNCH_START, LUNCH_END = 12 * 60, 13 * 60 + 30
+
 def ema(series, length):
     return series.ewm(span=length, adjust=False).mean()
 
@@ -17,6 +46,44 @@ def vwap(df):
     p = df['close']
     return (p * q).cumsum() / q.cumsum()
 
+def day_ids(ts):
+    """int64 day number (days since epoch) for each datetime64 timestamp."""
+    return ts.astype("datetime64[D]").view("int64")
+
+def moving_mean(values, length):
+    """Trailing mean over `length` values, NaN until the window is full."""
+    if bn is not None:
+        return bn.move_mean(values, length)
+    return pd.Series(values).rolling(length).mean().to_numpy()
+
+def minutes_of_day(ts):
+    """Minutes since midnight (int16) for each datetime64[ns] timestamp."""
+    return (ts.view("int64") // 60_000_000_000 % 1440).astype(np.int16)
+
+def hhmm_to_minutes(hhmm):
+    """'0915' / 915 -> 555 minutes since midnight."""
+    hhmm = int(hhmm)
+    return hhmm // 100 * 60 + hhmm % 100
+
+def previous_day_high_low(day_id, high, low):
+    """
+    Per-row high/low of the previous trading day (NaN on the first day).
+    Rows must be in time order so each day is one contiguous run.
+    """
+    new_day = np.empty(len(day_id), dtype=bool)
+    new_day[:1] = True
+    np.not_equal(day_id[1:], day_id[:-1], out=new_day[1:])
+
+    day_start = np.flatnonzero(new_day)
+    if len(day_start) == 0:
+        return np.empty(0), np.empty(0)
+
+    day_high = np.concatenate(([np.nan], np.maximum.reduceat(high, day_start)[:-1]))
+    day_low = np.concatenate(([np.nan], np.minimum.reduceat(low, day_start)[:-1]))
+
+    day_idx = np.cumsum(new_day) - 1
+    return day_high[day_idx], day_low[day_idx]
+
 def compute_intraday_strategy(df,
                               ema_len=200,
                               vol_len=20,
@@ -27,186 +94,281 @@ def compute_intraday_strategy(df,
                               only_first_break=True,
                               avoid_lunch=True,
                               trade_start="0915",
-                              trade_end="1525"):
+                              trade_end="1525",
+                              engine="pandas"):
 
-    df = df.copy()
+    trade_start = hhmm_to_minutes(trade_start)
+    trade_end = hhmm_to_minutes(trade_end)
 
     # ============================================================
-    # Indicators
+    # Indicators + Conditions
     # ============================================================
 
-    df["EMA200"] = ema(df["close"], ema_len)
-    df["VWAP"] = vwap(df)
-    df["VolMA"] = df["volume"].rolling(vol_len).mean()
-
-    # Previous Day High/Low (PDH / PDL)
-    df["date"] = df["timestamp"].dt.date
-    daily_high = df.groupby("date")["high"].max().shift(1)
-    daily_low  = df.groupby("date")["low"].min().shift(1)
-
-    df["PDH"] = df["date"].map(daily_high)
-    df["PDL"] = df["date"].map(daily_low)
-
-    # Time numeric (HHMM)
-    df["HH"] = df["timestamp"].dt.hour
-    df["MM"] = df["timestamp"].dt.minute
-    df["curTime"] = df["HH"] * 100 + df["MM"]
-
-    trade_start = int(trade_start)
-    trade_end = int(trade_end)
-
-    # Session logic
-    df["in_session"] = (df["curTime"] >= trade_start) & (df["curTime"] <= trade_end)
-    df["in_lunch"] = avoid_lunch & (df["curTime"].between(1200, 1330))
-    df["can_trade"] = df["in_session"] & (~df["in_lunch"])
+    if engine == "pandas":
+        signals = _pandas_signals(df, ema_len, vol_len, vol_mult, vwap_dist_pct,
+                                  avoid_lunch, trade_start, trade_end)
+    elif engine == "polars":
+        if pl is None:
+            raise ImportError("engine='polars' requires the polars package")
+        signals = _polars_signals(df, ema_len, vol_len, vol_mult, vwap_dist_pct,
+                                  avoid_lunch, trade_start, trade_end)
+    else:
+        raise ValueError(f"Unknown engine: {engine!r}")
 
     # ============================================================
-    # Conditions
+    # Execution Loop (Tick-by-tick)
     # ============================================================
 
-    df["vol_ok"] = df["volume"] > (df["VolMA"] * vol_mult)
+    close = signals[2]
+    ts = df["timestamp"].to_numpy()
+
+    entry_idx, exit_idx, exit_price, side, reason = _run_execution_loop(
+        *signals,
+        trade_end,
+        rr_ratio,
+        sl_buffer_pct,
+    )
+
+    return pd.DataFrame({
+        "entry_time": ts[entry_idx],
+        "exit_time": ts[exit_idx],
+        "entry_price": close[entry_idx],
+        "exit_price": exit_price,
+        "side": SIDE_NAMES[side],
+        "reason": REASON_NAMES[reason],
+    }, columns=TRADE_COLUMNS)
+
+
+def _pandas_signals(df, ema_len, vol_len, vol_mult, vwap_dist_pct,
+                    avoid_lunch, trade_start, trade_end):
+    """
+    Indicator/condition arrays built with pandas/NumPy. The input frame is
+    only read, never copied or written to.
+
+    Returns the leading array arguments of _run_execution_loop, in order.
+    """
+    close = df["close"].to_numpy(dtype=np.float64)
+    high = df["high"].to_numpy(dtype=np.float64)
+    low = df["low"].to_numpy(dtype=np.float64)
+    volume = df["volume"].to_numpy(dtype=np.float64)
+
+    ema200 = ema(df["close"], ema_len).to_numpy(dtype=np.float64)
+    vwap_arr = vwap(df).to_numpy(dtype=np.float64)
+    vol_ma = moving_mean(volume, vol_len)
 
-    df["dist_pct"] = (df["close"] - df["VWAP"]).abs() / df["VWAP"] * 100
-    df["vwap_ok"] = df["dist_pct"] >= vwap_dist_pct
+    # Previous Day High/Low (PDH / PDL)
+    stamps = df["timestamp"]
+    if stamps.dt.tz is not None:
+        stamps = stamps.dt.tz_localize(None)  # keep local wall-clock time
+    ts = stamps.to_numpy(dtype="datetime64[ns]")
+    day_id = day_ids(ts)
+    pdh, pdl = previous_day_high_low(day_id, high, low)
 
-    df["uptrend"] = df["close"] > df["EMA200"]
-    df["downtrend"] = df["close"] < df["EMA200"]
+    # Time numeric (minutes of day)
+    minute = minutes_of_day(ts)
 
-    # Breakouts
-    df["long_break"] = (df["close"] > df["PDH"]) & (df["close"].shift(1) <= df["PDH"])
-    df["short_break"] = (df["close"] < df["PDL"]) & (df["close"].shift(1) >= df["PDL"])
+    # Session logic
+    in_session = (minute >= trade_start) & (minute <= trade_end)
+    in_lunch = avoid_lunch & (minute >= LUNCH_START) & (minute <= LUNCH_END)
+    can_trade = in_session & ~in_lunch
+
+    # NaN warm-up values compare False, as in the pandas version
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vol_ok = volume > vol_ma * vol_mult
+
+        dist_pct = np.abs(close - vwap_arr) / vwap_arr * 100
+        vwap_ok = dist_pct >= vwap_dist_pct
+
+        uptrend = close > ema200
+        downtrend = close < ema200
+
+        # Breakouts
+        prev_close = np.concatenate(([np.nan], close[:-1]))
+        long_break = (close > pdh) & (prev_close <= pdh)
+        short_break = (close < pdl) & (prev_close >= pdl)
+
+    return (day_id, minute, close, high, low, vwap_arr, can_trade, vol_ok,
+            vwap_ok, uptrend, downtrend, long_break, short_break)
+
+
+def _polars_signals(df, ema_len, vol_len, vol_mult, vwap_dist_pct,
+                    avoid_lunch, trade_start, trade_end):
+    """
+    Same columns as _pandas_signals, built as one lazy Polars query.
+
+    Nulls (warm-up rows, first day without PDH/PDL) and NaN VWAP are treated
+    as False in the conditions, matching the pandas comparisons.
+    """
+    close = pl.col("close")
+    vwap_col = pl.col("VWAP")
+    minute = pl.col("minute")
+
+    lf = (
+        pl.from_pandas(df[["timestamp", "high", "low", "close", "volume"]])
+        .lazy()
+        .with_columns(
+            pl.col("timestamp").dt.date().alias("date"),
+            (pl.col("timestamp").dt.hour().cast(pl.Int16) * 60
+             + pl.col("timestamp").dt.minute()).alias("minute"),
+            close.ewm_mean(span=ema_len, adjust=False).alias("EMA200"),
+            ((close * pl.col("volume")).cum_sum() / pl.col("volume").cum_sum())
+            .fill_nan(None).alias("VWAP"),
+            pl.col("volume").rolling_mean(vol_len).alias("VolMA"),
+        )
+    )
 
-    # ============================================================
-    # Execution Loop (Tick-by-tick)
-    # ============================================================
+    # Previous Day High/Low (PDH / PDL)
+    daily = (
+        lf.group_by("date")
+        .agg(pl.col("high").max().alias("PDH"), pl.col("low").min().alias("PDL"))
+        .sort("date")
+        .with_columns(pl.col("PDH").shift(1), pl.col("PDL").shift(1))
+    )
+    lf = lf.join(daily, on="date", how="left", maintain_order="left")
+
+    in_lunch = minute.is_between(LUNCH_START, LUNCH_END) if avoid_lunch else pl.lit(False)
+    out = lf.select(
+        pl.col("date").rle_id().alias("day_id"),
+        minute,
+        close,
+        pl.col("high"),
+        pl.col("low"),
+        vwap_col.fill_null(np.nan),
+        ((minute >= trade_start) & (minute <= trade_end) & ~in_lunch).alias("can_trade"),
+        (pl.col("volume") > pl.col("VolMA") * vol_mult).alias("vol_ok"),
+        ((close - vwap_col).abs() / vwap_col * 100 >= vwap_dist_pct).alias("vwap_ok"),
+        (close > pl.col("EMA200")).alias("uptrend"),
+        (close < pl.col("EMA200")).alias("downtrend"),
+        ((close > pl.col("PDH")) & (close.shift(1) <= pl.col("PDH"))).alias("long_break"),
+        ((close < pl.col("PDL")) & (close.shift(1) >= pl.col("PDL"))).alias("short_break"),
+    ).collect()
+
+    return (
+        out["day_id"].to_numpy().astype(np.int64),
+        out["minute"].to_numpy().astype(np.int16),
+        out["close"].to_numpy().astype(np.float64),
+        out["high"].to_numpy().astype(np.float64),
+        out["low"].to_numpy().astype(np.float64),
+        out["VWAP"].to_numpy().astype(np.float64),
+        *(out[name].fill_null(False).to_numpy().astype(np.bool_)
+          for name in ("can_trade", "vol_ok", "vwap_ok", "uptrend",
+                       "downtrend", "long_break", "short_break")),
+    )
+
+
+@njit(cache=True)
+def _run_execution_loop(day_ids, minute, close, high, low, vwap,
+                        can_trade, vol_ok, vwap_ok, uptrend, downtrend,
+                        long_break, short_break,
+                        trade_end, rr_ratio, sl_buffer_pct):
+    """
+    SL/TP state machine over plain NumPy arrays (one element per candle).
+
+    Returns (entry_idx, exit_idx, exit_price, side, reason) arrays with one
+    element per trade; side and reason are codes into SIDE_NAMES / REASON_NAMES.
+    """
+    n = len(close)
+    entry_idx = np.empty(n, dtype=np.int64)
+    exit_idx = np.empty(n, dtype=np.int64)
+    exit_price = np.empty(n, dtype=np.float64)
+    side_code = np.empty(n, dtype=np.int64)
+    reason_code = np.empty(n, dtype=np.int64)
+    count = 0
 
-    trades = []
     longTakenToday = False
     shortTakenToday = False
-    active_position = None
-
-    prev_date = None
 
-    for i in range(len(df)):
+    # Active position: entry index, SL, TP, side (-1 when flat)
+    entry_i = -1
+    sl = 0.0
+    tp = 0.0
+    side = -1
 
-        row = df.iloc[i]
-        cur_date = row["date"]
+    for i in range(n):
 
         # Reset daily flags at new day
-        if prev_date is not None and cur_date != prev_date:
+        if i > 0 and day_ids[i] != day_ids[i - 1]:
             longTakenToday = False
             shortTakenToday = False
-        prev_date = cur_date
+
+        exit_px = 0.0
+        reason = -1
 
         # Forced square-off at session end
-        if row["curTime"] == trade_end and active_position is not None:
-            entry, sl, tp, side = active_position
-
-            trades.append({
-                "entry_time": entry["timestamp"],
-                "exit_time": row["timestamp"],
-                "entry_price": entry["close"],
-                "exit_price": row["close"],
-                "side": side,
-                "reason": "Forced Square-Off"
-            })
-            active_position = None
-            continue
+        if minute[i] == trade_end and side != -1:
+            exit_px = close[i]
+            reason = SQUARE_OFF
 
         # If a trade is running, check SL/TP
-        if active_position is not None:
-            entry, sl, tp, side = active_position
-
-            if side == "LONG":
-                # SL hit
-                if row["low"] <= sl:
-                    trades.append({
-                        "entry_time": entry["timestamp"],
-                        "exit_time": row["timestamp"],
-                        "entry_price": entry["close"],
-                        "exit_price": sl,
-                        "side": side,
-                        "reason": "SL Hit"
-                    })
-                    active_position = None
-                    continue
-
-                # TP hit
-                if row["high"] >= tp:
-                    trades.append({
-                        "entry_time": entry["timestamp"],
-                        "exit_time": row["timestamp"],
-                        "entry_price": entry["close"],
-                        "exit_price": tp,
-                        "side": side,
-                        "reason": "TP Hit"
-                    })
-                    active_position = None
-                    continue
-
-            if side == "SHORT":
-                if row["high"] >= sl:
-                    trades.append({
-                        "entry_time": entry["timestamp"],
-                        "exit_time": row["timestamp"],
-                        "entry_price": entry["close"],
-                        "exit_price": sl,
-                        "side": side,
-                        "reason": "SL Hit"
-                    })
-                    active_position = None
-                    continue
-
-                if row["low"] <= tp:
-                    trades.append({
-                        "entry_time": entry["timestamp"],
-                        "exit_time": row["timestamp"],
-                        "entry_price": entry["close"],
-                        "exit_price": tp,
-                        "side": side,
-                        "reason": "TP Hit"
-                    })
-                    active_position = None
-                    continue
+        elif side == LONG:
+            if low[i] <= sl:
+                exit_px = sl
+                reason = SL_HIT
+            elif high[i] >= tp:
+                exit_px = tp
+                reason = TP_HIT
+
+        elif side == SHORT:
+            if high[i] >= sl:
+                exit_px = sl
+                reason = SL_HIT
+            elif low[i] <= tp:
+                exit_px = tp
+                reason = TP_HIT
+
+        if reason != -1:
+            entry_idx[count] = entry_i
+            exit_idx[count] = i
+            exit_price[count] = exit_px
+            side_code[count] = side
+            reason_code[count] = reason
+            count += 1
+            side = -1
+            continue
 
         # No new entries if position is open
-        if active_position is not None:
+        if side != -1:
             continue
 
         # === Entry Logic ===
 
         # Long Entry
         if (
-            row["can_trade"] and
-            row["vol_ok"] and
-            row["vwap_ok"] and
-            row["uptrend"] and
-            row["long_break"] and
+            can_trade[i] and
+            vol_ok[i] and
+            vwap_ok[i] and
+            uptrend[i] and
+            long_break[i] and
             (not longTakenToday)
         ):
-            sl_vwap = row["VWAP"] * (1 - sl_buffer_pct/100)
-            sl = min(sl_vwap, row["low"])
-            if sl < row["close"]:
-                risk = row["close"] - sl
-                tp = row["close"] + (risk * rr_ratio)
-                active_position = (row, sl, tp, "LONG")
+            sl_vwap = vwap[i] * (1 - sl_buffer_pct/100)
+            new_sl = min(sl_vwap, low[i])
+            if new_sl < close[i]:
+                risk = close[i] - new_sl
+                entry_i = i
+                sl = new_sl
+                tp = close[i] + (risk * rr_ratio)
+                side = LONG
                 longTakenToday = True
 
         # Short Entry
         elif (
-            row["can_trade"] and
-            row["vol_ok"] and
-            row["vwap_ok"] and
-            row["downtrend"] and
-            row["short_break"] and
+            can_trade[i] and
+            vol_ok[i] and
+            vwap_ok[i] and
+            downtrend[i] and
+            short_break[i] and
             (not shortTakenToday)
         ):
-            sl_vwap = row["VWAP"] * (1 + sl_buffer_pct/100)
-            sl = max(sl_vwap, row["high"])
-            if sl > row["close"]:
-                risk = sl - row["close"]
-                tp = row["close"] - (risk * rr_ratio)
-                active_position = (row, sl, tp, "SHORT")
+            sl_vwap = vwap[i] * (1 + sl_buffer_pct/100)
+            new_sl = max(sl_vwap, high[i])
+            if new_sl > close[i]:
+                risk = new_sl - close[i]
+                entry_i = i
+                sl = new_sl
+                tp = close[i] - (risk * rr_ratio)
+                side = SHORT
                 shortTakenToday = True
 
-    return pd.DataFrame(trades)
+    return (entry_idx[:count], exit_idx[:count], exit_price[:count],
+            side_code[:count], reason_code[:count])
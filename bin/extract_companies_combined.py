@@ -1,7 +1,21 @@
-import csv
 import json
 import sys
 
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, stdlib json is just slower
+    orjson = None
+
+
+def load_json_file(json_file):
+    """Parse a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(json_file, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(json_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
 def extract_companies_from_multiple_files(json_files, csv_file):
     """
@@ -12,13 +26,13 @@ def extract_companies_from_multiple_files(json_files, csv_file):
         csv_file: Path to output CSV file
     """
     try:
-        all_companies = {}
+        seen = set()
+        companies_list = []
         
         for json_file in json_files:
             print(f"\nReading JSON file: {json_file}")
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                data = load_json_file(json_file)
                 
                 if not isinstance(data, list) or len(data) == 0:
                     print(f"Warning: {json_file} is empty or not an array, skipping...")
@@ -38,11 +52,12 @@ def extract_companies_from_multiple_files(json_files, csv_file):
                             continue
                         
                         # Create a unique key with exchange to differentiate NSE/BSE listings
-                        key = (name, symbol, exchange)
+                        key = f"{exchange}\x1f{symbol}\x1f{name}"
                         
                         # Store if not already present
-                        if key not in all_companies:
-                            all_companies[key] = {
+                        if key not in seen:
+                            seen.add(key)
+                            companies_list.append({
                                 'name': name,
                                 'trading_symbol': symbol,
                                 'exchange': exchange,
@@ -50,7 +65,7 @@ def extract_companies_from_multiple_files(json_files, csv_file):
                                 'segment': item.get('segment', ''),
                                 'instrument_type': item.get('instrument_type', ''),
                                 'short_name': item.get('short_name', '')
-                            }
+                            })
                 
             except FileNotFoundError:
                 print(f"Warning: File '{json_file}' not found, skipping...")
@@ -59,44 +74,35 @@ def extract_companies_from_multiple_files(json_files, csv_file):
                 print(f"Warning: Invalid JSON in '{json_file}' - {e}, skipping...")
                 continue
         
-        if not all_companies:
+        if not companies_list:
             print("\nError: No valid data found in any of the files")
             return False
         
         print(f"\n{'='*80}")
-        print(f"Total unique company-symbol-exchange combinations: {len(all_companies)}")
+        print(f"Total unique company-symbol-exchange combinations: {len(companies_list)}")
         
-        # Convert to list and sort by exchange, then company name
-        companies_list = sorted(all_companies.values(), 
-                               key=lambda x: (x['exchange'], x['name']))
+        # Sort by exchange, then company name (stable, like list.sort)
+        fieldnames = ['exchange', 'name', 'trading_symbol', 'short_name', 'isin', 'segment', 'instrument_type']
+        companies = pd.DataFrame(companies_list, columns=fieldnames)
+        companies = companies.sort_values(['exchange', 'name'], kind='stable', ignore_index=True)
         
         # Write to CSV
         print(f"Writing to CSV file: {csv_file}")
-        fieldnames = ['exchange', 'name', 'trading_symbol', 'short_name', 'isin', 'segment', 'instrument_type']
-        
-        with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(companies_list)
+        companies.to_csv(csv_file, index=False, encoding='utf-8', lineterminator='\r\n')
         
-        print(f"Successfully extracted {len(companies_list)} unique companies to CSV!")
+        print(f"Successfully extracted {len(companies)} unique companies to CSV!")
         
         # Show statistics by exchange
         print("\nStatistics by Exchange:")
         print("-" * 80)
-        exchange_counts = {}
-        for company in companies_list:
-            exchange = company['exchange']
-            exchange_counts[exchange] = exchange_counts.get(exchange, 0) + 1
-        
-        for exchange, count in sorted(exchange_counts.items()):
+        for exchange, count in companies['exchange'].value_counts(sort=False).sort_index().items():
             print(f"  {exchange}: {count} entries")
         
         # Show sample entries
         print("\nSample entries:")
         print("-" * 80)
-        for i, company in enumerate(companies_list[:10]):
-            print(f"{i+1}. [{company['exchange']}] {company['name']} -> {company['trading_symbol']}")
+        for i, company in enumerate(companies.head(10).itertuples(index=False)):
+            print(f"{i+1}. [{company.exchange}] {company.name} -> {company.trading_symbol}")
         
         return True
         
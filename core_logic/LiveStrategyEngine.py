@@ -1,18 +1,68 @@
+import logging
+import math
 import os
 import sys
-from datetime import datetime, timedelta
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import groupby, islice
+from operator import itemgetter
 
 import numpy as np
 import pandas as pd
 import pytz
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the kernels just run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from core_logic.logger_config import get_logger
 from database_logic.candle_db import CandleDB
-from database_logic.fetch_historical_candles import UpstoxHistoricalFetcher
+from database_logic.fetch_historical_candles import (UpstoxHistoricalFetcher,
+                                                     previous_trading_days)
 
 logger = get_logger()
 
+# Candle buffer layout (SoA): one contiguous row per OHLCV field
+CANDLE_COLUMNS = ["open", "high", "low", "close", "volume"]
+BUFFER_CAPACITY = 512  # comfortably above the 210 candles the strategy needs
+CANDLE_FLUSH_SIZE = 6  # completed candles held before one batched DB write
+CANDLE_FLUSH_SECONDS = 600  # or this long since the last write, bounding what a crash or kill loses
+
+# Tick times are UTC epoch milliseconds, candles are naive IST; both are
+# handled as integer 5-minute bucket numbers (epoch ms // CANDLE_MS)
+IST_OFFSET_MS = (5 * 60 + 30) * 60_000
+CANDLE_MS = 5 * 60_000
+
+@njit(cache=True)
+def ema_last(close, alpha):
+    """Final value of the adjust=False EMA recurrence over close"""
+    ema = close[0]
+    for i in range(1, len(close)):
+        ema = alpha * close[i] + (1 - alpha) * ema
+    return ema
+
+
+@dataclass(slots=True)
+class Tick:
+    """Last-trade fields of one full-feed update (ltt is epoch milliseconds)"""
+    ltp: float
+    ltt: int
+    ltq: int
+    cp: float = 0.0
+
+    @classmethod
+    def from_feed(cls, feed):
+        """Build from the dict form of a full feed: {'marketFF': {'ltpc': {...}}}"""
+        ltpc = feed["marketFF"]["ltpc"]
+        return cls(float(ltpc["ltp"]), int(ltpc["ltt"]), int(ltpc["ltq"]), float(ltpc.get("cp", 0.0)))
+
 
 class LiveStrategyEngine:
     def __init__(self, symbol=None, instrument_key=None):
@@ -25,8 +75,14 @@ class LiveStrategyEngine:
         db_path = os.path.join(root_folder, 'market_data.db')
         self.db = CandleDB(db_path=db_path)
         
-        self.df = pd.DataFrame(columns=["timestamp","open","high","low","close","volume"])
-        self.current_minute = None
+        # Preallocated candle buffer, columns [0, _size) are valid (oldest first)
+        self._buf = np.zeros((len(CANDLE_COLUMNS), BUFFER_CAPACITY), dtype=np.float64)
+        self._ts = np.zeros(BUFFER_CAPACITY, dtype="datetime64[ns]")
+        self._bind_columns()
+        self._size = 0
+        self._pending_candles = []  # completed candles not yet written to DB
+        self._last_flush = time.monotonic()
+        self.current_bucket = None  # 5-minute bucket of the live candle
         self.minute=None
         # State
         self.long_taken_today = False
@@ -35,10 +91,6 @@ class LiveStrategyEngine:
         self.pdh = None
         self.pdl = None
         self.today_date = None
-        
-        # Load historical data from DB
-        if self.symbol:
-            self._load_historical_data()
 
         # Strategy parameters
         self.EMA_LEN = 200
@@ -51,21 +103,138 @@ class LiveStrategyEngine:
         self.trade_start = 930 #changed startup time 915 -> 930 
         self.trade_end = 1525
 
-    def fetch_last_3_working_days(self):
-        """Fetch the last 3 working days as strings in 'YYYY-MM-DD' format"""
-        today = datetime.now().date()
-        working_days = []
-        day_offset = 1  # Start from yesterday
+        # Indicator state over completed candles (every buffered candle but the last)
+        self._reset_indicators()
+        
+        # Load historical data from DB
+        if self.symbol:
+            self._load_historical_data()
+
+    def __copy__(self):
+        """Copy with its own candle, indicator and position state; the DB connection is shared"""
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone._buf = self._buf.copy()
+        clone._ts = self._ts.copy()
+        clone._bind_columns()
+        clone._pending_candles = list(self._pending_candles)
+        clone._vol_window = deque(self._vol_window, maxlen=self._vol_window.maxlen)
+        if self.active_position:
+            clone.active_position = dict(self.active_position)
+        return clone
+
+    def _bind_columns(self):
+        """Per-field 1-D views into the candle buffer"""
+        self._open, self._high, self._low, self._close, self._volume = self._buf
+
+    @property
+    def df(self):
+        """Buffered candles as a DataFrame (oldest first)"""
+        n = self._size
+        df = pd.DataFrame(self._buf[:, :n].T, columns=CANDLE_COLUMNS, copy=True)
+        df.insert(0, "timestamp", self._ts[:n])
+        return df
+
+    @df.setter
+    def df(self, df):
+        """Replace the buffered candles with the last BUFFER_CAPACITY rows of df"""
+        ts = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+        close = df["close"].to_numpy(dtype=np.float64)
+        volume = df["volume"].to_numpy(dtype=np.float64)
+
+        # Indicators run over the full history (all but the last, in-progress
+        # candle), not just the buffered tail
+        self._reset_indicators()
+        if len(df) > 1:
+            hist_close, hist_volume = close[:-1], volume[:-1]
+            hist_day = ts[:-1].astype("datetime64[D]")
+
+            self._ema = float(ema_last(hist_close, 2 / (self.EMA_LEN + 1)))
+
+            self._vwap_day = hist_day[-1]
+            same_day = hist_day == self._vwap_day
+            self._vwap_num = float(np.dot(hist_close[same_day], hist_volume[same_day]))
+            self._vwap_den = float(hist_volume[same_day].sum())
+
+            window = hist_volume[len(hist_volume) - self._vol_window.maxlen:]
+            self._vol_window.extend(window.tolist())
+            self._vol_sum = float(window.sum())
+
+        df = df.tail(BUFFER_CAPACITY)
+        n = len(df)
+        self._buf[:, :n] = df[CANDLE_COLUMNS].to_numpy(dtype=np.float64).T
+        self._ts[:n] = ts[len(ts) - n:]
+        self._size = n
+
+    def _reset_indicators(self):
+        self._ema = None  # EMA of close (adjust=False)
+        self._vwap_day = None  # VWAP resets every day
+        self._vwap_num = 0.0
+        self._vwap_den = 0.0
+        self._vol_window = deque(maxlen=self.VOL_LEN - 1)
+        self._vol_sum = 0.0
+
+    def _commit_candle(self, ts, close, volume):
+        """Fold a completed candle into the running EMA / VWAP / volume sums"""
+        alpha = 2 / (self.EMA_LEN + 1)
+        self._ema = close if self._ema is None else alpha * close + (1 - alpha) * self._ema
+
+        day = ts.astype("datetime64[D]")
+        if day != self._vwap_day:
+            self._vwap_day = day
+            self._vwap_num = 0.0
+            self._vwap_den = 0.0
+        self._vwap_num += close * volume
+        self._vwap_den += volume
+
+        if len(self._vol_window) == self._vol_window.maxlen:
+            self._vol_sum -= self._vol_window[0]
+        self._vol_window.append(volume)
+        self._vol_sum += volume
+
+    def _current_indicators(self):
+        """EMA, VWAP and volume MA including the in-progress (last) candle"""
+        i = self._size - 1
+        close = self._close[i]
+        volume = self._volume[i]
+
+        alpha = 2 / (self.EMA_LEN + 1)
+        ema = close if self._ema is None else alpha * close + (1 - alpha) * self._ema
+
+        if self._ts[i].astype("datetime64[D]") == self._vwap_day:
+            vwap_num = self._vwap_num + close * volume
+            vwap_den = self._vwap_den + volume
+        else:
+            vwap_num = close * volume
+            vwap_den = volume
+        vwap = vwap_num / vwap_den if vwap_den else math.nan
 
-        while len(working_days) < int(os.getenv("STOCK_DAYS_NEED", "3")):
-            target_date = today - timedelta(days=day_offset)
-            day_offset += 1
+        if len(self._vol_window) == self._vol_window.maxlen:
+            vol_ma = (self._vol_sum + volume) / self.VOL_LEN
+        else:
+            vol_ma = math.nan
 
-            # Skip weekends
-            if target_date.weekday() >= 5:  # Saturday=5, Sunday=6
-                continue
+        return ema, vwap, vol_ma
 
-            working_days.append(target_date.strftime("%Y-%m-%d"))
+    def _append_candle(self, ts, price, vol):
+        """Start a new candle, dropping the oldest half of the buffer when full"""
+        if self._size == BUFFER_CAPACITY:
+            keep = BUFFER_CAPACITY // 2
+            self._buf[:, :keep] = self._buf[:, -keep:]
+            self._ts[:keep] = self._ts[-keep:]
+            self._size = keep
+
+        i = self._size
+        self._open[i] = self._high[i] = self._low[i] = self._close[i] = price
+        self._volume[i] = vol
+        self._ts[i] = ts
+        self._size += 1
+
+    def fetch_last_3_working_days(self):
+        """Fetch the last 3 working days as strings in 'YYYY-MM-DD' format"""
+        today = datetime.now().date()
+        days = int(os.getenv("STOCK_DAYS_NEED", "3"))
+        working_days = [day.strftime("%Y-%m-%d") for day in islice(previous_trading_days(today), days)]
 
         working_days.reverse()  # Earliest date first
         return working_days[0], working_days[-1]
@@ -80,8 +249,11 @@ class LiveStrategyEngine:
         self.db.cleanup_old_candles(days_to_keep=int(os.getenv("STOCK_DAYS_NEED", "3")))
         df = self.db.get_candles(self.symbol, start_date=start_date, end_date=end_date, interval=os.getenv("INTERVAL", "5m"))
         
-        logger.info(f"[{self.symbol}] Historical data preview:")
-        logger.info(f"[{self.symbol}] {df.tail(3).to_string()}")
+        logger.info(f"[{self.symbol}] Historical data preview: {len(df)} candles")
+        if len(df) > 0 and logger.isEnabledFor(logging.DEBUG):
+            last = df.iloc[-1]
+            logger.debug(f"[{self.symbol}] Last candle: {last['timestamp']} O={last['open']} H={last['high']} "
+                         f"L={last['low']} C={last['close']} V={last['volume']}")
     
          
         if not self.instrument_key:
@@ -97,12 +269,12 @@ class LiveStrategyEngine:
         df = self.db.get_candles(self.symbol, interval=os.getenv("INTERVAL", "5m"))
     
         if len(df) > 0:
-            # Convert to numeric types immediately
-            df["open"] = pd.to_numeric(df["open"], errors='coerce')
-            df["high"] = pd.to_numeric(df["high"], errors='coerce')
-            df["low"] = pd.to_numeric(df["low"], errors='coerce')
-            df["close"] = pd.to_numeric(df["close"], errors='coerce')
-            df["volume"] = pd.to_numeric(df["volume"], errors='coerce')
+            # Convert to numeric types immediately. SQLite REAL/INTEGER columns
+            # come back numeric already; only stray text values need coercing.
+            try:
+                df[CANDLE_COLUMNS] = df[CANDLE_COLUMNS].astype(np.float64)
+            except (TypeError, ValueError):
+                df[CANDLE_COLUMNS] = df[CANDLE_COLUMNS].apply(pd.to_numeric, errors='coerce')
             
             self.df = df
             logger.info(f"[{self.symbol}] Loaded {len(self.df)} historical candles from database")
@@ -114,124 +286,155 @@ class LiveStrategyEngine:
         else:
             logger.info(f"[{self.symbol}] No historical data available")
     
-    def _save_completed_candle(self, candle_data):
-        """Save a completed candle to the database"""
+    def _save_completed_candle(self, candle):
+        """
+        Queue a completed (timestamp, open, high, low, close, volume) row,
+        writing to the database every CANDLE_FLUSH_SIZE candles or CANDLE_FLUSH_SECONDS
+        """
+        self._pending_candles.append(candle)
+        if (len(self._pending_candles) >= CANDLE_FLUSH_SIZE
+                or time.monotonic() - self._last_flush >= CANDLE_FLUSH_SECONDS):
+            self.flush_candles()
+
+    def flush_candles(self):
+        """Write all queued candles to the database in one transaction"""
+        if not self._pending_candles:
+            return
         try:
-            self.db.insert_candle(
-                symbol=self.symbol,
-                timestamp=candle_data['timestamp'],
-                open_price=candle_data['open'],
-                high=candle_data['high'],
-                low=candle_data['low'],
-                close=candle_data['close'],
-                volume=candle_data['volume'],
-                interval='5'
-            )
+            candles = pd.DataFrame(self._pending_candles, columns=["timestamp", *CANDLE_COLUMNS])
+            self.db.insert_candles_df(candles, symbol=self.symbol, interval='5')
+            self._pending_candles = []
+            self._last_flush = time.monotonic()
         except Exception as e:
-            logger.error(f"[{self.symbol}] Error saving candle to DB: {e}")
+            logger.error(f"[{self.symbol}] Error saving candles to DB: {e}")
 
     # ---------------------------------------------
     # Update candle from live tick
     # ---------------------------------------------
+    def _candle_start(self, tick):
+        """5-minute bucket (IST epoch ms // CANDLE_MS) a tick belongs to"""
+        return (tick.ltt + IST_OFFSET_MS) // CANDLE_MS
+
+    def _start_candle(self, bucket, price, vol):
+        """Close out the current candle and open a new one for bucket"""
+        # Save the previous completed candle to DB
+        if self.current_bucket is not None and self._size > 0:
+            i = self._size - 1
+            self._save_completed_candle((self._ts[i], *self._buf[:, i].tolist()))
+        
+        if self._size > 0:
+            i = self._size - 1
+            self._commit_candle(self._ts[i], self._close[i], self._volume[i])
+
+        self.current_bucket = bucket
+        minute_ts = np.datetime64(bucket * CANDLE_MS, "ms")
+        self._append_candle(minute_ts, float(price), float(vol))
+        logger.info(f"[{self.symbol}] New 5-min candle created | df length: {self._size} | Time: {minute_ts.astype(datetime)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            o, h, l, c, v = self._buf[:, self._size - 1]
+            logger.debug(f"[{self.symbol}] Last candle: {minute_ts.astype(datetime)} O={o} H={h} L={l} C={c} V={v}")
+
     def update_candle(self, tick):
-        ts = int(tick["marketFF"]["ltpc"]["ltt"]) // 1000
-        # Unix timestamp is always UTC, convert to IST as naive datetime
-        ts = datetime.utcfromtimestamp(ts)
-        # Add IST offset manually (UTC + 5:30)
-        from datetime import timedelta
-        ts = ts + timedelta(hours=5, minutes=30)
-        price = tick["marketFF"]["ltpc"]["ltp"]
-        vol = int(tick["marketFF"]["ltpc"]["ltq"])
-
-        # Round timestamp to nearest 5-minute interval
-        minute_ts = ts.replace(second=0, microsecond=0)
-        minute_ts = minute_ts.replace(minute=(minute_ts.minute // 5) * 5)
+        # Accept a Tick or the raw full-feed dict
+        if not isinstance(tick, Tick):
+            tick = Tick.from_feed(tick)
+        price = tick.ltp
+        vol = tick.ltq
+        bucket = self._candle_start(tick)
 
         # every 5 minutes create new candle
-        if self.current_minute != minute_ts:
-            # Save the previous completed candle to DB
-            if self.current_minute is not None and len(self.df) > 0:
-                last_candle = self.df.iloc[-1]
-                self._save_completed_candle({
-                    'timestamp': last_candle['timestamp'],
-                    'open': last_candle['open'],
-                    'high': last_candle['high'],
-                    'low': last_candle['low'],
-                    'close': last_candle['close'],
-                    'volume': last_candle['volume']
-                })
-            
-            self.current_minute = minute_ts
-            # Ensure numeric types
-            self.df.loc[len(self.df)] = [minute_ts, float(price), float(price), float(price), float(price), float(vol)]
-            logger.info(f"[{self.symbol}] New 5-min candle created | df length: {len(self.df)} | Time: {minute_ts}")
-            logger.info(f"[{self.symbol}] Last 3 candles: {self.df.tail(3).to_string()}")
+        if self.current_bucket != bucket:
+            self._start_candle(bucket, price, vol)
         else:
             # Update candle
-            idx = self.df.index[-1]
-            self.df.at[idx, "high"] = max(self.df.at[idx, "high"], price)
-            self.df.at[idx, "low"] = min(self.df.at[idx, "low"], price)
-            self.df.at[idx, "close"] = price
-            self.df.at[idx, "volume"] += vol
+            i = self._size - 1
+            if price > self._high[i]:
+                self._high[i] = price
+            if price < self._low[i]:
+                self._low[i] = price
+            self._close[i] = price
+            self._volume[i] += vol
+
+        return self.process_strategy()
+
+    def update_candles_batch(self, ticks):
+        """
+        Fold a batch of ticks (oldest first) into the candles and run the
+        strategy once on the final state. Ticks that fall in the same 5-minute
+        candle are merged with a single max/min/sum.
+        """
+        if not ticks:
+            return None
+
+        ticks = [t if isinstance(t, Tick) else Tick.from_feed(t) for t in ticks]
+        buckets = [self._candle_start(t) for t in ticks]
+
+        for bucket, run in groupby(zip(buckets, ticks), key=itemgetter(0)):
+            prices = []
+            vol = 0
+            for _, tick in run:
+                prices.append(tick.ltp)
+                vol += tick.ltq
+
+            if self.current_bucket != bucket:
+                self._start_candle(bucket, prices[0], 0)
+
+            i = self._size - 1
+            self._high[i] = max(self._high[i], max(prices))
+            self._low[i] = min(self._low[i], min(prices))
+            self._close[i] = prices[-1]
+            self._volume[i] += vol
 
         return self.process_strategy()
 
     
     def process_strategy(self):
-        if len(self.df) < 210:
-            logger.info(f"[{self.symbol}] Not enough data for strategy processing ({len(self.df)}/210 candles)")
+        if self._size < 210:
+            logger.info(f"[{self.symbol}] Not enough data for strategy processing ({self._size}/210 candles)")
             return None
 
-        df = self.df.copy()
-        
-        # Date change reset
-        cur_date = df.iloc[-1]["timestamp"].date()
+        # Date change reset (dates compared as int64 day ids)
+        cur_date = int(self._ts[self._size - 1].astype("datetime64[D]").view("int64"))
         if self.today_date != cur_date:
             self.today_date = cur_date
             self.long_taken_today = False
             self.short_taken_today = False
 
             # Compute PDH/PDL from yesterday
-            prev = df[df["timestamp"].dt.date != cur_date]
-            if len(prev) > 0:
-                self.pdh = prev["high"].max()
-                self.pdl = prev["low"].min()
+            day_ids = self._ts[:self._size].astype("datetime64[D]").view("int64")
+            prev = day_ids != cur_date
+            if prev.any():
+                self.pdh = self._high[:self._size][prev].max()
+                self.pdl = self._low[:self._size][prev].min()
         # Indicators
-        
-        df["EMA200"] = df["close"].ewm(span=self.EMA_LEN).mean()
-        df["VWAP"] = (df["close"] * df["volume"]).cumsum() / df["volume"].cumsum()
-        df["VolMA"] = df["volume"].rolling(self.VOL_LEN).mean()
-        
-        
-        
-        
-        
-        
-        
+        ema200, vwap, vol_ma = self._current_indicators()
 
-        row = df.iloc[-1]
-        prev = df.iloc[-2]
+        # Unpack the last candle to plain floats once, straight from the buffer
+        i = self._size - 1
+        _, high, low, close, volume = self._buf[:, i].tolist()
+        prev_close = float(self._close[i - 1])
 
-        curTime = row.timestamp.hour * 100 + row.timestamp.minute
+        minute_of_day = int(self._ts[self._size - 1].view("int64") // 60_000_000_000 % 1440)
+        curTime = minute_of_day // 60 * 100 + minute_of_day % 60
         can_trade = (self.trade_start <= curTime <= self.trade_end)
 
 
         # Volume OK - handle NaN VolMA
-        if pd.isna(row.VolMA):
+        if math.isnan(vol_ma):
             vol_ok = False
         else:
-            vol_ok = row.volume > row.VolMA * self.VOL_MULT
+            vol_ok = volume > vol_ma * self.VOL_MULT
         # VWAP distance
-        dist_pct = abs(row.close - row.VWAP) / row.VWAP * 100
+        dist_pct = abs(close - vwap) / vwap * 100
         vwap_ok = dist_pct >= self.VWAP_DIST
 
         # Trend
-        uptrend = row.close > row.EMA200
-        downtrend = row.close < row.EMA200
+        uptrend = close > ema200
+        downtrend = close < ema200
 
         # Breakouts
-        long_break = self.pdh is not None and row.close > self.pdh and prev.close <= self.pdh
-        short_break = self.pdl is not None and row.close < self.pdl and prev.close >= self.pdl
+        long_break = self.pdh is not None and close > self.pdh and prev_close <= self.pdh
+        short_break = self.pdl is not None and close < self.pdl and prev_close >= self.pdl
 
             
 
@@ -245,20 +448,20 @@ class LiveStrategyEngine:
             tp = pos["tp"]
 
             if pos["side"] == "LONG":
-                if row.low <= sl:
+                if low <= sl:
                     self.active_position = None
                     return {"signal":"EXIT","reason":"SL HIT","exit_price":sl}
 
-                if row.high >= tp:
+                if high >= tp:
                     self.active_position = None
                     return {"signal":"EXIT","reason":"TP HIT","exit_price":tp}
 
             if pos["side"] == "SHORT":
-                if row.high >= sl:
+                if high >= sl:
                     self.active_position = None
                     return {"signal":"EXIT","reason":"SL HIT","exit_price":sl}
 
-                if row.low <= tp:
+                if low <= tp:
                     self.active_position = None
                     return {"signal":"EXIT","reason":"TP HIT","exit_price":tp}
 
@@ -274,20 +477,20 @@ class LiveStrategyEngine:
             uptrend and
             long_break 
         ):
-            sl_vwap = row.VWAP * (1 - self.SL_BUFFER/100)
-            sl = min(sl_vwap, row.low)
+            sl_vwap = vwap * (1 - self.SL_BUFFER/100)
+            sl = min(sl_vwap, low)
 
-            if sl < row.close:
-                risk = row.close - sl
-                tp = row.close + risk * self.RR
+            if sl < close:
+                risk = close - sl
+                tp = close + risk * self.RR
 
                 self.active_position = {
                     "side": "LONG",
-                    "entry": row.close,
+                    "entry": close,
                     "sl": sl,
                     "tp": tp
                 }
-                return {"signal":"BUY", "entry_price":row.close, "sl":sl, "tp":tp}
+                return {"signal":"BUY", "entry_price":close, "sl":sl, "tp":tp}
 
         # ===============================
         # ENTRY: SHORT
@@ -299,18 +502,18 @@ class LiveStrategyEngine:
             downtrend and
             short_break 
         ):
-            sl_vwap = row.VWAP * (1 + self.SL_BUFFER/100)
-            sl = max(sl_vwap, row.high)
+            sl_vwap = vwap * (1 + self.SL_BUFFER/100)
+            sl = max(sl_vwap, high)
 
-            if sl > row.close:
-                risk = sl - row.close
-                tp = row.close - risk * self.RR
+            if sl > close:
+                risk = sl - close
+                tp = close - risk * self.RR
 
                 self.active_position = {
                     "side":"SHORT",
-                    "entry":row.close,
+                    "entry":close,
                     "sl":sl,
                     "tp":tp
                 }
-                return {"signal":"SELL", "entry_price":row.close, "sl":sl, "tp":tp}
+                return {"signal":"SELL", "entry_price":close, "sl":sl, "tp":tp}
         return None
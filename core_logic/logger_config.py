@@ -2,20 +2,28 @@
 Logger Configuration Module
 Centralized logging setup for the stock trading bot
 """
-import glob
+import atexit
 import logging
 import os
+import queue
 import time
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+# Background listener that owns the file/console handlers
+_listener = None
 
 
 def setup_logging():
     """
-    Configure logging with daily rotation and 10-day cleanup
+    Configure logging with daily rotation and 10-day cleanup.
+    Records are queued on the calling thread and written by a background
+    QueueListener, so log I/O stays off the tick path.
     
     Returns:
         logging.Logger: Configured logger instance
     """
+    global _listener
+
     # create logs folder in the parent directory if it doesn't exist
     log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
     os.makedirs(log_dir, exist_ok=True)
@@ -53,13 +61,28 @@ def setup_logging():
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
     
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # Hand records to a background thread that writes them to the handlers
+    stop_logging()
+    log_queue = queue.Queue(-1)
+    logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
     
     return logger
 
 
+def stop_logging():
+    """
+    Flush queued log records and stop the background listener
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
 def cleanup_old_logs(log_dir, days=10):
     """
     Delete log files older than specified days
@@ -70,15 +93,15 @@ def cleanup_old_logs(log_dir, days=10):
     """
     try:
         cutoff_time = time.time() - (days * 86400)  # 86400 seconds in a day
-        log_pattern = os.path.join(log_dir, 'stock_bot.log*')
         
-        for log_file in glob.glob(log_pattern):
-            if os.path.isfile(log_file):
-                file_time = os.path.getmtime(log_file)
-                if file_time < cutoff_time:
-                    os.remove(log_file)
+        # scandir entries carry their stat result, one syscall per file
+        with os.scandir(log_dir) as entries:
+            for entry in entries:
+                if (entry.name.startswith('stock_bot.log') and entry.is_file()
+                        and entry.stat().st_mtime < cutoff_time):
+                    os.remove(entry.path)
                     # Use print here since logger isn't set up yet
-                    print(f"Deleted old log file: {log_file}")
+                    print(f"Deleted old log file: {entry.path}")
     except Exception as e:
         # Use print here since logger isn't set up yet
         print(f"Error cleaning up old logs: {e}")
@@ -96,3 +119,4 @@ def get_logger():
 
 # Initialize logging when module is imported
 _logger = setup_logging()
+atexit.register(stop_logging)
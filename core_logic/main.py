@@ -1,17 +1,21 @@
-import datetime
 import os
+import signal
 import sys
 import threading
 import time
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, SimpleQueue
 
 import upstox_client
 from dotenv import load_dotenv
-from LiveStrategyEngine import LiveStrategyEngine
+from LiveStrategyEngine import LiveStrategyEngine, Tick
+from upstox_client.feeder.proto import MarketDataFeedV3_pb2
 
 # Add parent directory to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from core_logic.logger_config import get_logger
+from database_logic.candle_db import CandleDB
 from telegram_bot.telegram_alerts import (format_signal_message,
                                           send_telegram_alert)
 
@@ -27,18 +31,32 @@ if not SYMBOLS_ENV:
     logger.error("Error: SYMBOLS not set in .env file")
     exit(1)
 
-# Parse multiple instrument keys
-INSTRUMENT_KEYS = [key.strip() for key in SYMBOLS_ENV.split(",")]
+# Parse multiple instrument keys (once; blanks and duplicates dropped so no
+# engine is built or historical data fetched twice)
+INSTRUMENT_KEYS = list(dict.fromkeys(key.strip() for key in SYMBOLS_ENV.split(",") if key.strip()))
 
-# Create a dictionary of engines for each stock
-engines = {}
-for instrument_key in INSTRUMENT_KEYS:
-    symbol = instrument_key.split("|")[1] if "|" in instrument_key else None
-    if symbol:
-        logger.info(f"Initializing LiveStrategyEngine for {symbol} ({instrument_key})...")
-        engines[instrument_key] = LiveStrategyEngine(symbol=symbol, instrument_key=instrument_key)
-    else:
+
+def build_engine(instrument_key):
+    """LiveStrategyEngine for one instrument key, or None if the key is malformed"""
+    _, _, symbol = instrument_key.partition("|")
+    if not symbol:
         logger.warning(f"Warning: Invalid instrument key format: {instrument_key}")
+        return None
+    logger.info(f"Initializing LiveStrategyEngine for {symbol} ({instrument_key})...")
+    return LiveStrategyEngine(symbol=symbol, instrument_key=instrument_key)
+
+
+# Create a dictionary of engines for each stock. Construction is mostly
+# historical-candle HTTP fetches, so the engines are built on a thread pool.
+engines = {}
+if INSTRUMENT_KEYS:
+    # Each engine opens its own CandleDB; create/migrate the schema once, here,
+    # so the parallel constructors only ever see the finished table
+    CandleDB(db_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'market_data.db'))).close()
+    with ThreadPoolExecutor(max_workers=min(16, len(INSTRUMENT_KEYS))) as executor:
+        for instrument_key, engine in zip(INSTRUMENT_KEYS, executor.map(build_engine, INSTRUMENT_KEYS)):
+            if engine is not None:
+                engines[instrument_key] = engine
 
 if not engines:
     logger.error("Error: No valid symbols found")
@@ -46,71 +64,173 @@ if not engines:
 
 logger.info(f"Tracking {len(engines)} stocks: {list(engines.keys())}")
 
-def on_message(msg):
-    if msg["type"] != "live_feed":
-        return
+# instrument_key -> (engine, symbol), resolved once for the feed handler
+ENGINE_TABLE = {key: (engine, engine.symbol) for key, engine in engines.items()}
+
+# Ticks queued by the websocket thread, drained in batches by the main loop
+PENDING_TICKS = {key: deque() for key in ENGINE_TABLE}
+TICK_BATCH_INTERVAL = 0.1  # seconds of ticks collected per batch dispatch
+ticks_ready = threading.Event()  # set by on_message, waited on by main()
+
+# (symbol, signal) pairs handed to the alert thread, so a slow Telegram
+# round-trip never holds up tick dispatch
+ALERT_QUEUE = SimpleQueue()
+ALERT_BATCH_WINDOW = 0.5  # seconds of signals folded into one message
+ALERT_MAX_CHARS = 4000  # stay under Telegram's 4096-char message limit
+ALERT_SEPARATOR = "\n---\n"
+
+LIVE_FEED = MarketDataFeedV3_pb2.Type.Value("live_feed")
+
+
+class TickStreamer(upstox_client.MarketDataStreamerV3):
+    """
+    Streamer that reads the LTPC fields straight from the decoded protobuf
+    and emits a list of (instrument_key, Tick), skipping the SDK's
+    MessageToDict conversion of the whole feed.
+    """
+
+    def handle_message(self, ws, message):
+        decoded = self.decode_protobuf(message)
+        if decoded.type != LIVE_FEED:
+            return
+
+        ticks = []
+        for instrument_key, feed in decoded.feeds.items():
+            if instrument_key not in ENGINE_TABLE or feed.WhichOneof("FeedUnion") != "fullFeed":
+                continue
+            ltpc = feed.fullFeed.marketFF.ltpc
+            ticks.append((instrument_key, Tick(ltpc.ltp, ltpc.ltt, ltpc.ltq, ltpc.cp)))
 
-    # Process each feed in the message
-    for instrument_key, feed_data in msg["feeds"].items():
-        if instrument_key not in engines:
+        if ticks:
+            self.emit(self.Event["MESSAGE"], ticks)
+
+
+def on_message(ticks):
+    # Queue each (instrument_key, Tick); dispatch_ticks() runs the engines
+    for instrument_key, tick in ticks:
+        PENDING_TICKS[instrument_key].append(tick)
+    ticks_ready.set()
+
+
+def dispatch_ticks():
+    """Hand every engine the ticks queued since the last call, in one batch"""
+    for instrument_key, queue in PENDING_TICKS.items():
+        if not queue:
             continue
+        batch = [queue.popleft() for _ in range(len(queue))]
+        engine, symbol = ENGINE_TABLE[instrument_key]
         
-        feed = feed_data["fullFeed"]
-        engine = engines[instrument_key]
-        
-        result = engine.update_candle(feed)
-        
-        ltp = feed["marketFF"]["ltpc"]["ltp"]
-        symbol = engine.symbol
+        result = engine.update_candles_batch(batch)
         
         if result:
             logger.info(f"[{symbol}] SIGNAL: {result}")
-            
-            # Send Telegram alert
+            ALERT_QUEUE.put_nowait((symbol, result))
+
+
+def split_alert_text(messages):
+    """Join formatted signals into as few chunks of at most ALERT_MAX_CHARS as possible"""
+    chunks = []
+    current = ""
+    for message in messages:
+        if current and len(current) + len(ALERT_SEPARATOR) + len(message) > ALERT_MAX_CHARS:
+            chunks.append(current)
+            current = message
+        else:
+            current = f"{current}{ALERT_SEPARATOR}{message}" if current else message
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def alert_worker():
+    """
+    Send queued signals to Telegram until a None sentinel arrives.
+    Blocks on the first signal, then drains whatever else arrives within
+    ALERT_BATCH_WINDOW so a burst goes out as one message.
+    """
+    running = True
+    while running:
+        batch = [ALERT_QUEUE.get()]
+        deadline = time.monotonic() + ALERT_BATCH_WINDOW
+        while batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
-                telegram_message = format_signal_message(symbol, result)
-                send_telegram_alert(telegram_message)
+                batch.append(ALERT_QUEUE.get(timeout=remaining))
+            except Empty:
+                break
+        if batch[-1] is None:
+            running = False
+            batch.pop()
+
+        messages = []
+        for symbol, result in batch:
+            try:
+                messages.append(format_signal_message(symbol, result))
             except Exception as e:
-                logger.error(f"[{symbol}] Error sending Telegram alert: {e}")
+                logger.error(f"[{symbol}] Error formatting Telegram alert: {e}")
+
+        # Send Telegram alert
+        for text in split_alert_text(messages):
+            try:
+                send_telegram_alert(text)
+            except Exception as e:
+                logger.error(f"Error sending Telegram alert: {e}")
 
 
 def start_streamer():
     configuration = upstox_client.Configuration()
     configuration.access_token = os.getenv("UPSTOX_ACCESS_TOKEN")
 
-    streamer = upstox_client.MarketDataStreamerV3(
+    streamer = TickStreamer(
         upstox_client.ApiClient(configuration),
-        INSTRUMENT_KEYS,  # Pass all instrument keys
+        list(engines),  # Pass all valid instrument keys
         "full"
     )
 
     streamer.on("message", on_message)
-    streamer.connect()  # This blocks forever
+    streamer.connect()  # Returns at once, the SDK runs the websocket on its own thread
+    return streamer
 
 def wait_next_minute():
-    now = datetime.now()
-    next_min = (now.replace(second=0, microsecond=0) + timedelta(minutes=1))
-    sleep_seconds = (next_min - now + timedelta(seconds=3)).total_seconds()
+    sleep_seconds = 60 - time.time() % 60 + 3
     logger.info(f"Sleeping until next minute: {sleep_seconds:.2f} seconds...")
     time.sleep(sleep_seconds)
 
 
 def main():
 
-    thread = threading.Thread(target=start_streamer, daemon=True)
+    alert_thread = threading.Thread(target=alert_worker, name="telegram-alerts", daemon=True)
+    alert_thread.start()
 
     logger.info("Waiting for next minute to start streamer...")
     # wait_next_minute()
-    thread.start()
+    # No wrapper thread: ticks are handled directly on the SDK's websocket thread
+    start_streamer()
 
     logger.info("Streaming... Press CTRL+C to stop")
 
+    # bot_controller stops us with SIGTERM; take the same path as CTRL+C
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
     try:
         while True:
-            time.sleep(1)   # prevents 100% CPU load
+            # Sleep until the streamer queues ticks, then let a batch build up
+            ticks_ready.wait()
+            time.sleep(TICK_BATCH_INTERVAL)
+            ticks_ready.clear()
+            dispatch_ticks()
     except KeyboardInterrupt:
         logger.info("Stopping program...")
-        # Graceful exit (thread is daemon, so it will exit too)
+        for engine in engines.values():
+            engine.flush_candles()
+        # Let alerts already queued go out before exiting
+        ALERT_QUEUE.put(None)
+        alert_thread.join(timeout=10)
+        # Graceful exit
         exit(0)
 
 if __name__ == "__main__":
@@ -1,21 +1,29 @@
 """
-Launcher script to run both main.py and telegram_bot.py concurrently
+Launcher script to run both main.py and the Telegram bot concurrently,
+each in its own process
 """
 import os
+import signal
 import sys
-import threading
 import time
 from datetime import datetime
+from multiprocessing import Process
+from multiprocessing.connection import wait
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
 
 def run_main():
     """Run the main trading bot"""
     print(f"[{datetime.now()}] Starting main trading bot...")
-    sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core_logic'))
+    # core_logic stays on the path for main.py's own sibling imports, but
+    # main itself is imported by package path so no other main.py can shadow it
+    sys.path.insert(0, os.path.join(ROOT_DIR, 'core_logic'))
+    sys.path.insert(0, ROOT_DIR)
     
     try:
         # Import and run main
-        import main
+        from core_logic import main
         main.main()
     except Exception as e:
         print(f"[{datetime.now()}] Error in main.py: {e}")
@@ -26,14 +34,14 @@ def run_main():
 def run_telegram_bot():
     """Run the Telegram bot"""
     print(f"[{datetime.now()}] Starting Telegram bot...")
-    sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'telegram_bot'))
+    sys.path.insert(0, ROOT_DIR)
     
     try:
         # Import and run telegram bot
-        from telegram_bot import telegram_bot
-        telegram_bot.run_telegram_bot()
+        from telegram_bot import bot_controller
+        bot_controller.main()
     except Exception as e:
-        print(f"[{datetime.now()}] Error in telegram_bot.py: {e}")
+        print(f"[{datetime.now()}] Error in bot_controller.py: {e}")
         import traceback
         traceback.print_exc()
 
@@ -45,15 +53,20 @@ def main():
     print(f"Time: {datetime.now()}")
     print()
     
-    # Create threads for both processes
-    main_thread = threading.Thread(target=run_main, name="MainBot", daemon=False)
-    telegram_thread = threading.Thread(target=run_telegram_bot, name="TelegramBot", daemon=False)
+    # One process per service so they don't share a GIL
+    main_proc = Process(target=run_main, name="MainBot")
+    telegram_proc = Process(target=run_telegram_bot, name="TelegramBot")
+    
+    # Turn SIGTERM into the same shutdown path as CTRL+C
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handle_sigterm)
     
-    # Start both threads
+    # Start both processes
     print("Launching both services...")
-    main_thread.start()
+    main_proc.start()
     time.sleep(2)  # Give main a head start
-    telegram_thread.start()
+    telegram_proc.start()
     
     print()
     print("Both services are running!")
@@ -62,19 +75,19 @@ def main():
     print()
     
     try:
-        # Keep the main thread alive
-        while True:
-            if not main_thread.is_alive():
-                print(f"\n[{datetime.now()}] WARNING: Main bot thread stopped!")
-            if not telegram_thread.is_alive():
-                print(f"\n[{datetime.now()}] WARNING: Telegram bot thread stopped!")
-            
-            time.sleep(5)
+        # Block until a service exits instead of polling is_alive()
+        running = {main_proc.sentinel: "Main bot", telegram_proc.sentinel: "Telegram bot"}
+        while running:
+            for sentinel in wait(list(running)):
+                print(f"\n[{datetime.now()}] WARNING: {running.pop(sentinel)} process stopped!")
+        print(f"[{datetime.now()}] Both services have stopped.")
     except KeyboardInterrupt:
         print(f"\n[{datetime.now()}] Stopping both services...")
-        print("Waiting for threads to finish...")
-        main_thread.join(timeout=5)
-        telegram_thread.join(timeout=5)
+        print("Waiting for processes to finish...")
+        for proc in (main_proc, telegram_proc):
+            if proc.is_alive():
+                proc.terminate()
+            proc.join(timeout=5)
         print("All services stopped.")
         sys.exit(0)
 
@@ -1,8 +1,13 @@
+import copy
 from datetime import datetime, timedelta
 
 import LiveStrategyEngine
+import numpy as np
 import pandas as pd
 
+# Built once (DB connection + buffers); each test works on a copy
+BLANK_ENGINE = LiveStrategyEngine.LiveStrategyEngine(symbol=None, instrument_key=None)
+
 
 def setup_engine_for_test(engine, trend="up"):
     """Setup existing engine with mock data for testing"""
@@ -14,32 +19,25 @@ def setup_engine_for_test(engine, trend="up"):
     engine.pdl = 113.0
     
     # Create 220 candles for proper EMA calculation
-    data = []
-    for i in range(220):
-        ts = base_time - timedelta(minutes=220-i)
-        
-        if trend == "up":
-            # Uptrend: rising prices BUT staying below PDH until last candle
-            base_price = 110 + (i * 0.02)  # Slower rise to stay below 115
-            if base_price > 114.5:  # Cap at 114.5 to be below PDH
-                base_price = 114.5
-        else:
-            # Downtrend: falling prices BUT staying above PDL until last candle
-            base_price = 120 - (i * 0.02)  # Slower fall to stay above 113
-            if base_price < 113.5:  # Floor at 113.5 to be above PDL
-                base_price = 113.5
-        
-        data.append({
-            'timestamp': ts,
-            'open': base_price,
-            'high': base_price + 0.3,
-            'low': base_price - 0.3,
-            'close': base_price,
-            'volume': 60000 + (i * 200)
-        })
-    
-    engine.df = pd.DataFrame(data)
-    engine.current_minute = data[-1]['timestamp']
+    i = np.arange(220)
+    timestamps = pd.date_range(end=base_time - timedelta(minutes=1), periods=220, freq="1min")
+    
+    if trend == "up":
+        # Uptrend: rising prices BUT staying below PDH until last candle
+        base_price = np.minimum(110 + (i * 0.02), 114.5)  # Slower rise, capped below PDH
+    else:
+        # Downtrend: falling prices BUT staying above PDL until last candle
+        base_price = np.maximum(120 - (i * 0.02), 113.5)  # Slower fall, floored above PDL
+    
+    engine.df = pd.DataFrame({
+        'timestamp': timestamps,
+        'open': base_price,
+        'high': base_price + 0.3,
+        'low': base_price - 0.3,
+        'close': base_price,
+        'volume': 60000 + (i * 200)
+    })
+    engine.current_bucket = int(timestamps[-1].timestamp() * 1000) // LiveStrategyEngine.CANDLE_MS
     
     return base_time
 
@@ -53,7 +51,7 @@ def test_long_breakout():
     # Initialize your engine without loading historical data
     symbol = "INE467B01029"
     instrument_key = f"NSE_EQ|{symbol}"
-    engine = LiveStrategyEngine.LiveStrategyEngine(symbol=None, instrument_key=None)
+    engine = copy.copy(BLANK_ENGINE)
     engine.symbol = symbol
     engine.instrument_key = instrument_key
     
@@ -111,7 +109,7 @@ def test_short_breakdown():
     # Initialize your engine without loading historical data
     symbol = "INE467B01029"
     instrument_key = f"NSE_EQ|{symbol}"
-    engine = LiveStrategyEngine.LiveStrategyEngine(symbol=None, instrument_key=None)
+    engine = copy.copy(BLANK_ENGINE)
     engine.symbol = symbol
     engine.instrument_key = instrument_key
     
@@ -169,7 +167,7 @@ def test_stop_loss():
     # Initialize your engine without loading historical data
     symbol = "INE467B01029"
     instrument_key = f"NSE_EQ|{symbol}"
-    engine = LiveStrategyEngine.LiveStrategyEngine(symbol=None, instrument_key=None)
+    engine = copy.copy(BLANK_ENGINE)
     engine.symbol = symbol
     engine.instrument_key = instrument_key
     
@@ -228,7 +226,7 @@ def test_take_profit():
     # Initialize your engine without loading historical data
     symbol = "INE467B01029"
     instrument_key = f"NSE_EQ|{symbol}"
-    engine = LiveStrategyEngine.LiveStrategyEngine(symbol=None, instrument_key=None)
+    engine = copy.copy(BLANK_ENGINE)
     engine.symbol = symbol
     engine.instrument_key = instrument_key
     
@@ -4,11 +4,17 @@ import os
 from dotenv import load_dotenv
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-from collections import deque
+import numpy as np
 
 load_dotenv()
 
-prices = deque(maxlen=200)
+# Ring buffer of the last PRICE_WINDOW samples; cursor is the next slot to
+# write, count how many slots hold data
+PRICE_WINDOW = 200
+prices = np.full(PRICE_WINDOW, np.nan)
+cursor = 0
+count = 0
+X_POINTS = np.arange(PRICE_WINDOW)
 latest_price = None
 
 # YOUR IRFC SYMBOL (from your output)
@@ -43,38 +49,56 @@ def start_streamer():
     streamer.connect()
 
 
-def update_graph(i):
+def update_graph(i, ax, line, dot, label):
+    global cursor, count
+
     if latest_price is not None:
-        prices.append(latest_price)
+        prices[cursor] = latest_price
+        cursor = (cursor + 1) % PRICE_WINDOW
+        count = min(count + 1, PRICE_WINDOW)
 
-    plt.cla()
+    if count == 0:
+        return line, dot, label
 
-    if len(prices) > 0:
-        plt.plot(prices, label=SYMBOLS)
+    # Oldest first; only a full (wrapped) ring needs reordering
+    ys = prices[:count] if count < PRICE_WINDOW else np.concatenate((prices[cursor:], prices[:cursor]))
+    last = ys[-1]
 
-        # Mark last price with red dot
-        plt.scatter(len(prices)-1, prices[-1], color='red', s=60)
+    # Move the existing artists instead of clearing and redrawing the axes
+    x = count - 1
+    line.set_data(X_POINTS[:count], ys)
+    dot.set_offsets([[x, last]])
+    label.set_position((x, last))
+    label.set_text(f"  {last}")
 
-        # Show live price as text
-        plt.text(
-            len(prices)-1,
-            prices[-1],
-            f"  {prices[-1]}",
-            fontsize=12,
-            color='red'
-        )
+    # Rescale (full redraw) only when the price leaves the current y-range
+    low, high = ax.get_ylim()
+    if not low <= last <= high:
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+        ax.figure.canvas.draw_idle()
 
-    plt.title(f"Live Price: {SYMBOLS}")
-    plt.xlabel("Last 200 Points")
-    plt.ylabel("Price")
-    plt.legend(loc="upper left")
+    return line, dot, label
 
 
 def main():
     thread = threading.Thread(target=start_streamer, daemon=True)
     thread.start()
 
-    ani = animation.FuncAnimation(plt.gcf(), update_graph, interval=1000)
+    # Axes, labels and legend are set up once; update_graph only moves artists
+    fig, ax = plt.subplots()
+    (line,) = ax.plot([], [], label=SYMBOLS)
+    dot = ax.scatter([], [], color='red', s=60)
+    label = ax.text(0, 0, "", fontsize=12, color='red')
+
+    ax.set_xlim(0, PRICE_WINDOW - 1)
+    ax.set_title(f"Live Price: {SYMBOLS}")
+    ax.set_xlabel("Last 200 Points")
+    ax.set_ylabel("Price")
+    ax.legend(loc="upper left")
+
+    ani = animation.FuncAnimation(fig, update_graph, fargs=(ax, line, dot, label),
+                                  interval=1000, blit=True, cache_frame_data=False)
     plt.show()
 
 
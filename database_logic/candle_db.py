@@ -1,182 +1,315 @@
 import os
 import sqlite3
 import sys
+import threading
 from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import islice
 from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 
 from core_logic.logger_config import get_logger
 
 logger = get_logger()
 
+DEFAULT_INTERVAL = os.getenv("INTERVAL", "5m")
+
+# Stored timestamps are UTC epoch seconds, naive datetimes are IST wall-clock
+IST_OFFSET = pd.Timedelta(hours=5, minutes=30)
+IST_OFFSET_SECONDS = int(IST_OFFSET.total_seconds())
+DAY_SECONDS = 24 * 60 * 60
+
+CANDLES_TABLE = """
+    CREATE TABLE {name} (
+        symbol TEXT NOT NULL,
+        interval TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        date_key INTEGER NOT NULL,
+        open REAL NOT NULL,
+        high REAL NOT NULL,
+        low REAL NOT NULL,
+        close REAL NOT NULL,
+        volume INTEGER NOT NULL,
+        PRIMARY KEY (symbol, interval, timestamp)
+    ) WITHOUT ROWID
+"""
+
+# Upsert in place; INSERT OR REPLACE deletes and re-inserts the row on
+# conflict. Re-fetched candles (e.g. today's still-forming last minute)
+# must still overwrite, so this is DO UPDATE rather than DO NOTHING
+INSERT_HEAD = """
+    INSERT INTO candles 
+    (symbol, timestamp, date_key, interval, open, high, low, close, volume)
+    VALUES """
+INSERT_ROW = "(?, ?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_UPSERT = """
+    ON CONFLICT (symbol, interval, timestamp) DO UPDATE SET
+        open = excluded.open, high = excluded.high, low = excluded.low,
+        close = excluded.close, volume = excluded.volume
+"""
+
+# Fixed SQL text for every hot query, so sqlite3's per-connection statement
+# cache always hits instead of re-preparing
+STATEMENTS = {
+    'insert': INSERT_HEAD + INSERT_ROW + INSERT_UPSERT,
+    'range': """
+        SELECT  timestamp, open, high, low, close, volume
+        FROM candles
+        WHERE symbol = ? AND interval = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp ASC
+    """,
+    'prev_day': """
+        SELECT MAX(high) as pdh, MIN(low) as pdl
+        FROM candles
+        WHERE symbol = ? AND interval = ? AND timestamp >= ? AND timestamp < ?
+    """,
+    'last_in_range': """
+        SELECT MAX(timestamp)
+        FROM candles
+        WHERE symbol = ? AND interval = ? AND timestamp >= ? AND timestamp < ?
+    """,
+    'latest': """
+        SELECT timestamp, open, high, low, close, volume
+        FROM candles
+        WHERE symbol = ? AND interval = ?
+        ORDER BY timestamp DESC
+        LIMIT 1
+    """,
+    'cleanup': "DELETE FROM candles WHERE timestamp < ?",
+}
+MULTI_ROW_LIMIT = 100  # batches smaller than this go in one multi-row INSERT
+ANALYZE_MIN_ROWS = 500  # inserts larger than this re-run ANALYZE
+INSERT_CHUNK_SIZE = 1000  # rows per executemany call within a batch transaction
+MAX_TIMESTAMP = 2 ** 62  # open upper bound for 'range'
+
+CANDLE_COLUMNS = ['symbol', 'timestamp', 'date_key', 'interval', 'open', 'high', 'low', 'close', 'volume']
+
+
+@lru_cache(maxsize=None)
+def multi_row_insert(rows: int) -> str:
+    """INSERT statement with a VALUES tuple per row, built once per row count"""
+    return INSERT_HEAD + ", ".join([INSERT_ROW] * rows) + INSERT_UPSERT
+
+
+def day_start(date_str: str) -> int:
+    """Epoch seconds of IST midnight on a 'YYYY-MM-DD' date"""
+    return int(pd.Timestamp(date_str).timestamp()) - IST_OFFSET_SECONDS
+
+
+def epoch_to_ist(epoch: int) -> pd.Timestamp:
+    """Naive IST wall-clock time of a stored epoch timestamp"""
+    return pd.Timestamp(epoch + IST_OFFSET_SECONDS, unit='s')
+
+
+def date_from_key(date_key: Optional[int]) -> Optional[str]:
+    """'YYYY-MM-DD' for a YYYYMMDD date_key"""
+    if date_key is None:
+        return None
+    return f"{date_key // 10000:04d}-{date_key // 100 % 100:02d}-{date_key % 100:02d}"
+
 
 class CandleDB:
     def __init__(self, db_path="market_data.db"):
         self.db_path = db_path
         self.conn = None
+        self._write_lock = threading.Lock()  # engines and the fetcher may write from other threads
         self._init_db()
     
     def _init_db(self):
         """Initialize database and create tables if they don't exist"""
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        
+        # WAL + synchronous=NORMAL: one fsync per checkpoint instead of per commit
+        for pragma in (
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            "PRAGMA temp_store=MEMORY",
+            "PRAGMA mmap_size=268435456",
+            "PRAGMA cache_size=-65536",
+        ):
+            self.conn.execute(pragma)
+        
         cursor = self.conn.cursor()
         
-        # Create candles table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS candles (
-                symbol TEXT NOT NULL,
-                timestamp INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                interval TEXT NOT NULL,
-                open REAL NOT NULL,
-                high REAL NOT NULL,
-                low REAL NOT NULL,
-                close REAL NOT NULL,
-                volume INTEGER NOT NULL,
-                PRIMARY KEY (symbol, timestamp, interval)
-            )
-        """)
+        # Create candles table. The primary key leads with (symbol, interval)
+        # and the table is clustered on it (WITHOUT ROWID), so a symbol's
+        # candles are one contiguous, time-ordered range of the B-tree
+        cursor.execute(CANDLES_TABLE.format(name="IF NOT EXISTS candles"))
+        self._migrate_schema(cursor)
         
-        # Create index for faster queries
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_symbol_date_interval 
-            ON candles(symbol, date, interval)
-        """)
+        # The clustered primary key replaces the old secondary indexes
+        cursor.execute("DROP INDEX IF EXISTS idx_symbol_date_interval")
+        cursor.execute("DROP INDEX IF EXISTS idx_symbol_interval_ts")
         
         self.conn.commit()
         logger.info(f"Database initialized: {self.db_path}")
     
+    def _migrate_schema(self, cursor):
+        """Rebuild a candles table from an older schema (TEXT 'date' column, rowid table)"""
+        if self._is_clustered(cursor):
+            return
+        
+        # Take the write lock first, then look again: another connection may have
+        # finished the migration while this one was waiting for it
+        cursor.execute("BEGIN IMMEDIATE")  # committed with the rest of _init_db
+        if self._is_clustered(cursor):
+            return
+        
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(candles)")}
+        date_key = "CAST(REPLACE(date, '-', '') AS INTEGER)" if 'date' in columns else "date_key"
+        
+        logger.info("Migrating candles table to the (symbol, interval, timestamp) clustered schema")
+        cursor.execute("ALTER TABLE candles RENAME TO candles_old")
+        cursor.execute("DROP INDEX IF EXISTS idx_symbol_date_interval")
+        cursor.execute("DROP INDEX IF EXISTS idx_symbol_interval_ts")
+        cursor.execute(CANDLES_TABLE.format(name="candles"))
+        cursor.execute(f"""
+            INSERT INTO candles (symbol, interval, timestamp, date_key, open, high, low, close, volume)
+            SELECT symbol, interval, timestamp, {date_key}, open, high, low, close, volume
+            FROM candles_old
+        """)
+        cursor.execute("DROP TABLE candles_old")
+    
+    @staticmethod
+    def _is_clustered(cursor) -> bool:
+        """True if the candles table already has the WITHOUT ROWID schema"""
+        table_sql = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'candles'"
+        ).fetchone()[0]
+        return "WITHOUT ROWID" in table_sql
+    
     def insert_candle(self, symbol: str, timestamp: datetime, 
                      open_price: float, high: float, low: float, 
-                     close: float, volume: int, interval: str = os.getenv("INTERVAL", "5m")):
+                     close: float, volume: int, interval: str = None):
         """Insert a single candle"""
-        cursor = self.conn.cursor()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO candles 
-            (symbol, timestamp, date, interval, open, high, low, close, volume)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            symbol,
-            int(timestamp.timestamp()),
-            timestamp.strftime("%Y-%m-%d"),
-            interval,
-            open_price,
-            high,
-            low,
-            close,
-            volume
-        ))
-        
-        self.conn.commit()
+        interval = interval or DEFAULT_INTERVAL
+        self.insert_candles_batch([{
+            'symbol': symbol,
+            'timestamp': timestamp,
+            'open': open_price,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': volume,
+            'interval': interval
+        }])
     
     def insert_candles_batch(self, candles: List[Dict]):
-        """Insert multiple candles efficiently"""
-        cursor = self.conn.cursor()
+        """Insert multiple candles efficiently, in a single transaction"""
+        self.insert_candles_df(pd.DataFrame(candles))
+    
+    def insert_candles_df(self, df: pd.DataFrame, symbol: str = None, interval: str = None):
+        """
+        Insert a DataFrame of candles in a single transaction
         
-        data = []
-        for candle in candles:
-            ts = candle['timestamp']
-            data.append((
-                candle['symbol'],
-                int(ts.timestamp()) if isinstance(ts, datetime) else ts,
-                ts.strftime("%Y-%m-%d") if isinstance(ts, datetime) else datetime.fromtimestamp(ts).strftime("%Y-%m-%d"),
-                candle.get('interval', '1m'),
-                candle['open'],
-                candle['high'],
-                candle['low'],
-                candle['close'],
-                candle['volume']
-            ))
-        
-        cursor.executemany("""
-            INSERT OR REPLACE INTO candles 
-            (symbol, timestamp, date, interval, open, high, low, close, volume)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, data)
+        Args:
+            df: columns timestamp (naive IST datetimes or epoch seconds),
+                open, high, low, close, volume and, unless passed below,
+                symbol and interval
+            symbol: Symbol for every row (overrides a 'symbol' column)
+            interval: Interval for every row (overrides an 'interval' column, default '1m')
+        """
+        if df.empty:
+            return
+        if interval is None:
+            interval = df['interval'] if 'interval' in df else '1m'
         
-        self.conn.commit()
-        logger.info(f"Inserted {len(candles)} candles")
+        ts = df['timestamp']
+        if pd.api.types.is_datetime64_any_dtype(ts):
+            wall = ts
+            epoch = (ts - IST_OFFSET).dt.as_unit('s').astype('int64')
+        else:
+            epoch = ts.astype('int64')
+            wall = pd.to_datetime(epoch, unit='s') + IST_OFFSET
+        
+        rows = pd.DataFrame({
+            'symbol': symbol if symbol is not None else df['symbol'],
+            'timestamp': epoch,
+            'date_key': wall.dt.year * 10000 + wall.dt.month * 100 + wall.dt.day,
+            'interval': interval,
+            'open': df['open'],
+            'high': df['high'],
+            'low': df['low'],
+            'close': df['close'],
+            'volume': df['volume']
+        }, columns=CANDLE_COLUMNS)
+        
+        # The connection context manager commits, or rolls back on error so a
+        # failed batch never leaves the database locked
+        with self._write_lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            tuples = rows.itertuples(index=False, name=None)
+            if len(rows) < MULTI_ROW_LIMIT:
+                # Small batches (a live flush, today's refresh): one statement
+                self.conn.execute(multi_row_insert(len(rows)), [value for row in tuples for value in row])
+            else:
+                while chunk := list(islice(tuples, INSERT_CHUNK_SIZE)):
+                    self.conn.executemany(STATEMENTS['insert'], chunk)
+        
+        # Refresh planner statistics after a bulk load (e.g. a historical backfill)
+        if len(rows) > ANALYZE_MIN_ROWS:
+            with self._write_lock:
+                self.conn.execute("ANALYZE candles")
+                self.conn.commit()
+        
+        logger.info(f"Inserted {len(rows)} candles")
     
     def get_candles(self, symbol: str, start_date:str = None, 
-                   end_date: str = None, interval: str = os.getenv("INTERVAL", "5m")) -> pd.DataFrame:
+                   end_date: str = None, interval: str = None) -> pd.DataFrame:
         """Get candles for a symbol within date range"""
-        query = """
-            SELECT  timestamp, open, high, low, close, volume
-            FROM candles
-            WHERE symbol = ? AND interval = ?
-        """
-        params = [symbol, interval]
-        if start_date:
-            query += " AND date >= ?"
-            params.append(start_date)
+        interval = interval or DEFAULT_INTERVAL
+        start = day_start(start_date) if start_date else 0
+        end = day_start(end_date) + DAY_SECONDS if end_date else MAX_TIMESTAMP
         
-        if end_date:
-            query += " AND date <= ?"
-            params.append(end_date)
-        
-        query += " ORDER BY timestamp ASC"
-        
-        df = pd.read_sql_query(query, self.conn, params=params)
+        df = pd.read_sql_query(STATEMENTS['range'], self.conn, params=(symbol, interval, start, end))
         
         if len(df) > 0:
-            # Convert Unix timestamp to datetime - timestamps are already in IST
-            # We use utc=True then remove timezone to get naive datetime matching stored IST values
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s', utc=True)
-            # Add IST offset (UTC + 5:30) and remove timezone info
-            df['timestamp'] = df['timestamp'] + pd.Timedelta(hours=5, minutes=30)
-            df['timestamp'] = df['timestamp'].dt.tz_localize(None)
+            # Convert Unix timestamp to naive IST datetime: add the fixed IST
+            # offset (UTC + 5:30) in int64 seconds and reinterpret as datetime64[ns]
+            seconds = df['timestamp'].to_numpy(dtype=np.int64) + IST_OFFSET_SECONDS
+            df['timestamp'] = (seconds * 1_000_000_000).view('datetime64[ns]')
         
         return df
     
-    def get_previous_day_high_low(self, symbol: str, current_date: str, interval: str = os.getenv("INTERVAL", "5m")) -> tuple:
+    def get_previous_day_high_low(self, symbol: str, current_date: str, interval: str = None) -> tuple:
         """Get previous day high and low"""
-        current = datetime.strptime(current_date, "%Y-%m-%d")
-        prev_date = (current - timedelta(days=1)).strftime("%Y-%m-%d")
-        
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT MAX(high) as pdh, MIN(low) as pdl
-            FROM candles
-            WHERE symbol = ? AND date = ? AND interval = ?
-        """, (symbol, prev_date, interval))
+        interval = interval or DEFAULT_INTERVAL
+        # Previous calendar day, as a [start, end) epoch range
+        prev_end = day_start(current_date)
+        prev_start = prev_end - DAY_SECONDS
         
-        result = cursor.fetchone()
+        result = self.conn.execute(STATEMENTS['prev_day'], (symbol, interval, prev_start, prev_end)).fetchone()
         
         if result and result[0] is not None:
             return result[0], result[1]  # PDH, PDL
         
         return None, None
     
+    def get_last_timestamp(self, symbol: str, start: int, end: int, interval: str = None) -> Optional[int]:
+        """Epoch seconds of the latest candle in [start, end), or None"""
+        interval = interval or DEFAULT_INTERVAL
+        return self.conn.execute(STATEMENTS['last_in_range'], (symbol, interval, start, end)).fetchone()[0]
+    
     def cleanup_old_candles(self, days_to_keep: int = 2):
         """Delete candles older than specified days"""
         cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).strftime("%Y-%m-%d")
         
-        cursor = self.conn.cursor()
-        cursor.execute("DELETE FROM candles WHERE date < ?", (cutoff_date,))
-        deleted = cursor.rowcount
-        self.conn.commit()
+        with self._write_lock, self.conn:
+            deleted = self.conn.execute(STATEMENTS['cleanup'], (day_start(cutoff_date),)).rowcount
         
         logger.info(f"Cleaned up {deleted} old candles (before {cutoff_date})")
         return deleted
     
-    def get_latest_candle(self, symbol: str, interval: str = os.getenv("INTERVAL", "5m")) -> Optional[Dict]:
+    def get_latest_candle(self, symbol: str, interval: str = None) -> Optional[Dict]:
         """Get the most recent candle for a symbol"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT timestamp, open, high, low, close, volume
-            FROM candles
-            WHERE symbol = ? AND interval = ?
-            ORDER BY timestamp DESC
-            LIMIT 1
-        """, (symbol, interval))
-        
-        result = cursor.fetchone()
+        interval = interval or DEFAULT_INTERVAL
+        result = self.conn.execute(STATEMENTS['latest'], (symbol, interval)).fetchone()
         
         if result:
             return {
-                'timestamp': datetime.fromtimestamp(result[0]),
+                'timestamp': epoch_to_ist(result[0]),
                 'open': result[1],
                 'high': result[2],
                 'low': result[3],
@@ -188,26 +321,20 @@ class CandleDB:
     
     def get_stats(self):
         """Get database statistics"""
-        cursor = self.conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM candles")
-        total_candles = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(DISTINCT symbol) FROM candles")
-        total_symbols = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT MIN(date), MAX(date) FROM candles")
-        date_range = cursor.fetchone()
+        total_candles, total_symbols, first_key, last_key = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT symbol), MIN(date_key), MAX(date_key) FROM candles"
+        ).fetchone()
         
         return {
             'total_candles': total_candles,
             'total_symbols': total_symbols,
-            'date_range': date_range
+            'date_range': (date_from_key(first_key), date_from_key(last_key))
         }
     
     def close(self):
         """Close database connection"""
         if self.conn:
+            self.conn.execute("PRAGMA optimize")
             self.conn.close()
             logger.info("Database connection closed")
 
@@ -1,12 +1,23 @@
 import os
 import sys
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import islice
 
-import pytz
+import numpy as np
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, falls back to response.json()
+    orjson = None
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from database_logic.candle_db import CandleDB
+from database_logic.candle_db import (DAY_SECONDS, IST_OFFSET_SECONDS, CandleDB,
+                                      day_start, epoch_to_ist)
 from dotenv import load_dotenv
 from core_logic.logger_config import get_logger
 
@@ -14,14 +25,103 @@ load_dotenv()
 
 logger = get_logger()
 
-# IST timezone
-IST = pytz.timezone('Asia/Kolkata')
+# Offset every Upstox timestamp is expected to carry
+IST_SUFFIX = "+05:30"
+
+LAST_CANDLE_SECONDS = (15 * 60 + 25) * 60  # a stored day is complete from 15:25 IST
+FETCH_WORKERS = 8  # concurrent day requests per instrument
+HTTP_TIMEOUT = 10  # seconds
+
+# One pooled keep-alive session shared by every fetcher (each engine builds
+# its own, concurrently), so TLS connections are reused across symbols and
+# days; requests already asks for gzip
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=16, pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+_session.headers.update({
+    'Content-Type': 'application/json',
+    'Accept': 'application/json'
+})
+
+# NSE trading holidays falling on weekdays, as published by the exchange each
+# December; more can be added through MARKET_HOLIDAYS in .env (comma-separated
+# YYYY-MM-DD), e.g. for a year not listed here yet
+NSE_HOLIDAYS = frozenset(date.fromisoformat(day) for day in (
+    "2025-02-26", "2025-03-14", "2025-03-31", "2025-04-10", "2025-04-14",
+    "2025-04-18", "2025-05-01", "2025-08-15", "2025-08-27", "2025-10-02",
+    "2025-10-21", "2025-10-22", "2025-11-05", "2025-12-25",
+    "2026-01-26", "2026-03-03", "2026-03-26", "2026-03-31", "2026-04-03",
+    "2026-04-14", "2026-05-01", "2026-05-28", "2026-06-26", "2026-09-14",
+    "2026-10-02", "2026-10-20", "2026-11-10", "2026-11-24", "2026-12-25",
+    *filter(None, (day.strip() for day in os.getenv("MARKET_HOLIDAYS", "").split(","))),
+))
+
+# Past the last listed year every weekday counts as a trading day, so a
+# holiday would be requested (and come back empty) instead of skipped
+if date.today().year > max(NSE_HOLIDAYS).year:
+    logger.warning(f"NSE holiday calendar ends in {max(NSE_HOLIDAYS).year}; "
+                   f"add {date.today().year} holidays to MARKET_HOLIDAYS in .env")
+
+CANDLE_FIELDS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+def parse_candles(raw_candles):
+    """
+    Convert Upstox candle rows to a candle DataFrame, a column at a time
+
+    Args:
+        raw_candles: [[timestamp_str, open, high, low, close, volume, oi], ...]
+            with timestamps like "2025-01-03T09:15:00+05:30"
+
+    Returns:
+        DataFrame with a naive IST minute 'timestamp', OHLC floats and an
+        int 'volume'
+    """
+    if not raw_candles:
+        return pd.DataFrame(columns=CANDLE_FIELDS)
+
+    raw = np.asarray(raw_candles, dtype=object)
+
+    # Timestamps already carry the IST offset, so the naive IST minute is
+    # just the first 16 characters ("2025-01-03T09:15"); anything else is
+    # parsed in full, shifted to IST and floored to the minute in int64 seconds
+    stamps = raw[:, 0].astype(str)
+    if np.char.endswith(stamps, IST_SUFFIX).all():
+        timestamps = stamps.astype("U16").astype("datetime64[m]")
+    else:
+        seconds = pd.to_datetime(stamps, utc=True, format="ISO8601").as_unit("s").asi8 + IST_OFFSET_SECONDS
+        seconds -= seconds % 60
+        timestamps = seconds.astype("datetime64[s]")
+
+    # One conversion for all five numeric fields; column-major so each
+    # field is a contiguous array
+    opens, highs, lows, closes, volumes = raw[:, 1:6].astype(np.float64, order="F").T
+
+    return pd.DataFrame({
+        'timestamp': timestamps,
+        'open': opens,
+        'high': highs,
+        'low': lows,
+        'close': closes,
+        'volume': volumes.astype(np.int64)
+    })
+
+
+def previous_trading_days(day):
+    """Weekdays before day that are not NSE_HOLIDAYS, most recent first"""
+    while True:
+        day -= timedelta(days=1)
+        if day.weekday() < 5 and day not in NSE_HOLIDAYS:  # Saturday=5, Sunday=6
+            yield day
 
 
 class UpstoxHistoricalFetcher:
     def __init__(self, access_token=None):
         self.access_token = access_token or os.getenv("UPSTOX_ACCESS_TOKEN")
         self.base_url = "https://api.upstox.com/v3/historical-candle"
+        self.auth_headers = {'Authorization': f'Bearer {self.access_token}'}
         
         # Get absolute path to root folder's market_data.db
         root_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -37,57 +137,78 @@ class UpstoxHistoricalFetcher:
             days: Number of days to fetch (default 2)
         """
         today = datetime.now().date()
+        interval = os.getenv('INTERVAL')
+        
+        # Extract symbol from instrument_key (e.g., NSE_EQ|INE467B01029 -> INE467B01029)
+        symbol = instrument_key.split("|")[1] if "|" in instrument_key else instrument_key
         
         all_candles = []
         trading_days_found = 0
-        day_offset = 1  # Start from yesterday
+        candidate_days = previous_trading_days(today)
         
-        # Keep going back until we find 'days' trading days
-        while trading_days_found < days:
-            target_date = today - timedelta(days=day_offset)
-            day_offset += 1
-            
-            # Skip weekends
-            if target_date.weekday() >= 5:  # Saturday=5, Sunday=6
-                logger.info(f"Skipping weekend: {target_date}")
-                continue
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            # Today's candles are fetched alongside the historical days
+            today_future = executor.submit(self._fetch_today, instrument_key)
             
-            logger.info(f"Fetching candles for {target_date}...")
-            
-            candles = self._fetch_single_day(instrument_key, target_date)
+            # Keep going back until we find 'days' trading days, fetching as
+            # many days at once as are still missing (an unlisted holiday
+            # comes back empty and is replaced by the next earlier day).
+            # Days already stored through the close are not fetched again.
+            while trading_days_found < days:
+                target_dates = []
+                for target_date in islice(candidate_days, days - trading_days_found):
+                    if self._day_complete(symbol, interval, target_date):
+                        trading_days_found += 1
+                        logger.info(f"✓ Candles for {target_date} already stored (Trading day {trading_days_found}/{days})")
+                    else:
+                        target_dates.append(target_date)
+                if not target_dates:
+                    continue
+                
+                logger.info(f"Fetching candles for {', '.join(map(str, target_dates))}...")
+                results = executor.map(lambda day: self._fetch_single_day(instrument_key, day), target_dates)
+                
+                for target_date, candles in zip(target_dates, results):
+                    if candles is not None and len(candles):
+                        all_candles.append(candles)
+                        trading_days_found += 1
+                        logger.info(f"✓ Fetched {len(candles)} candles for {target_date} (Trading day {trading_days_found}/{days})")
+                    else:
+                        logger.warning(f"✗ No candles found for {target_date}")
             
-            if candles:
-                all_candles.extend(candles)
-                trading_days_found += 1
-                logger.info(f"✓ Fetched {len(candles)} candles for {target_date} (Trading day {trading_days_found}/{days})")
-            else:
-                logger.warning(f"✗ No candles found for {target_date}")
+            logger.info("Fetching todays candles...")
+            candles_today = today_future.result()
         
-        logger.info("Fetching todays candles...")
-        candles_today = self._fetch_today(instrument_key)
-        if candles_today:
-            all_candles.extend(candles_today)
-            logger.info(f"✓ Fetched {len(candles_today)} candles for today ({today})")
+        if candles_today is not None and len(candles_today):
+            # Only store from the last stored candle on (re-writing that one,
+            # which may have been saved while still forming)
+            today_start = day_start(today.isoformat())
+            last = self.db.get_last_timestamp(symbol, today_start, today_start + DAY_SECONDS, interval=interval)
+            if last is not None:
+                candles_today = candles_today[candles_today['timestamp'] >= epoch_to_ist(last)]
+            all_candles.append(candles_today)
+            logger.info(f"✓ Fetched {len(candles_today)} new candles for today ({today})")
         else:
             logger.warning(f"✗ No candles found for today ({today})")
         
 
         # Store in database
         if all_candles:
-            # Extract symbol from instrument_key (e.g., NSE_EQ|INE467B01029 -> INE467B01029)
-            symbol = instrument_key.split("|")[1] if "|" in instrument_key else instrument_key
-            
-            # Add symbol to each candle
-            for candle in all_candles:
-                candle['symbol'] = symbol
+            all_candles = pd.concat(all_candles, ignore_index=True)
             
-            self.db.insert_candles_batch(all_candles)
+            self.db.insert_candles_df(all_candles, symbol=symbol, interval=interval)
             logger.info(f"✓ Total {len(all_candles)} candles stored in database")
         else:
             logger.warning("✗ No candles to store")
         
         return all_candles
     
+    def _day_complete(self, symbol: str, interval: str, day) -> bool:
+        """True if the database holds the day's candles through the market close"""
+        start = day_start(day.isoformat())
+        last = self.db.get_last_timestamp(symbol, start, start + DAY_SECONDS, interval=interval)
+        return last is not None and last >= start + LAST_CANDLE_SECONDS
+    
     def _fetch_today(self, instrument_key: str):
         """
         Fetch today's 1-minute candles up to current time
@@ -104,44 +225,18 @@ class UpstoxHistoricalFetcher:
         
         url = f"{self.base_url}/intraday/{encoded_key}/minutes/{os.getenv('INTERVAL')}/"
         
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
-        
         try:
-            response = requests.get(url, headers=headers)
+            response = _session.get(url, headers=self.auth_headers, timeout=HTTP_TIMEOUT)
             
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content) if orjson is not None else response.json()
                 
                 # Parse Upstox response
                 # Response format: {"data": {"candles": [[timestamp, open, high, low, close, volume, oi]]}}
                 if data.get('status') == 'success' and 'data' in data:
                     raw_candles = data['data'].get('candles', [])
                     
-                    # Convert to our format
-                    candles = []
-                    for candle in raw_candles:
-                        # Upstox candle format: [timestamp_str, open, high, low, close, volume, oi]
-                        timestamp_str = candle[0]
-                        
-                        # Parse timestamp (format: "2025-01-03T09:15:00+05:30")
-                        # Convert to IST and remove timezone info
-                        timestamp = datetime.fromisoformat(timestamp_str).astimezone(IST).replace(tzinfo=None)
-                        timestamp= timestamp.replace(second=0, microsecond=0)
-                        candles.append({
-                            'timestamp': timestamp,
-                            'open': float(candle[1]),
-                            'high': float(candle[2]),
-                            'low': float(candle[3]),
-                            'close': float(candle[4]),
-                            'volume': int(candle[5]),
-                            'interval': os.getenv('INTERVAL')
-                        })
-                    
-                    return candles
+                    return parse_candles(raw_candles)
                 else:
                     logger.error(f"Error: {data.get('message', 'Unknown error')}")
                     return []
@@ -169,44 +264,18 @@ class UpstoxHistoricalFetcher:
         
         url = f"{self.base_url}/{encoded_key}/minutes/{os.getenv('INTERVAL')}/{to_date}/{from_date}"
         
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
-        
         try:
-            response = requests.get(url, headers=headers)
+            response = _session.get(url, headers=self.auth_headers, timeout=HTTP_TIMEOUT)
             
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content) if orjson is not None else response.json()
                 
                 # Parse Upstox response
                 # Response format: {"data": {"candles": [[timestamp, open, high, low, close, volume, oi]]}}
                 if data.get('status') == 'success' and 'data' in data:
                     raw_candles = data['data'].get('candles', [])
                     
-                    # Convert to our format
-                    candles = []
-                    for candle in raw_candles:
-                        # Upstox candle format: [timestamp_str, open, high, low, close, volume, oi]
-                        timestamp_str = candle[0]
-                        
-                        # Parse timestamp (format: "2025-01-02T09:15:00+05:30")
-                        # Convert to IST and remove timezone info
-                        timestamp = datetime.fromisoformat(timestamp_str).astimezone(IST).replace(tzinfo=None)
-                        timestamp= timestamp.replace(second=0, microsecond=0)
-                        candles.append({
-                            'timestamp': timestamp,
-                            'open': float(candle[1]),
-                            'high': float(candle[2]),
-                            'low': float(candle[3]),
-                            'close': float(candle[4]),
-                            'volume': int(candle[5]),
-                            'interval': os.getenv('INTERVAL')
-                        })
-                    
-                    return candles
+                    return parse_candles(raw_candles)
                 else:
                     logger.error(f"Error: {data.get('message', 'Unknown error')}")
                     return []
@@ -2,63 +2,340 @@
 Telegram Bot Controller
 Interactive bot to control the stock trading program with a clean UI
 """
+import asyncio
 import os
-import subprocess
 import sys
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import time as dt_time
+from datetime import timedelta
+from enum import IntEnum
 from pathlib import Path
 
+try:
+    import uvloop
+except ImportError:  # uvloop is optional, the default asyncio loop is just slower
+    uvloop = None
+
+try:
+    import h2  # noqa: F401  (lets PTB's httpx client speak HTTP/2)
+    _BOT_HTTP_VERSION = "2"
+except ImportError:  # httpx[http2] is optional, HTTP/1.1 just opens more connections
+    _BOT_HTTP_VERSION = "1.1"
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
-from telegram.ext import (Application, CallbackQueryHandler, CommandHandler,
+from telegram.error import TimedOut
+from telegram.ext import (AIORateLimiter, Application, CallbackQueryHandler,
+                          CommandHandler,
                           ContextTypes, ConversationHandler, MessageHandler,
-                          filters)
+                          TypeHandler, filters)
 
 # Add parent directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from core_logic.logger_config import get_logger
-from telegram_bot.config import (AUTHORIZED_USERS, TELEGRAM_BOT_TOKEN,
-                                 TRADE_END_TIME, TRADE_START_TIME)
+from telegram_bot.config import (AUTHORIZED_USER_IDS, AUTHORIZED_USERS,
+                                 TELEGRAM_BOT_TOKEN, TRADE_END_TIME,
+                                 TRADE_START_TIME)
+from telegram_bot.env_file import ENV_WRITE_LOCK, replace_env_file
 from telegram_bot.symbol_lookup import get_lookup
-from telegram_bot.token_manager import get_token_manager
 
 logger = get_logger()
 
+# Project files, resolved once at import
+_ROOT = Path(__file__).resolve().parent.parent
+ENV_PATH = _ROOT / ".env"
+MAIN_SCRIPT = _ROOT / "core_logic" / "main.py"
+TRADING_LOG = _ROOT / "logs" / "trading.log"
+MARKET_DB = _ROOT / "market_data.db"
+
+_token_manager = None
+
+def get_token_manager():
+    """Get the shared TokenManager, importing it (and requests) on first use"""
+    global _token_manager
+    if _token_manager is None:
+        from telegram_bot.token_manager import get_token_manager as _get_token_manager
+        _token_manager = _get_token_manager()
+    return _token_manager
+
 # Conversation states
 ADDING_STOCK, REMOVING_STOCK, EXCHANGE_SELECTION, WAITING_AUTH_CODE = range(4)
 
-# Global variable to track the trading process
-trading_process = None
-trading_status = "stopped"
+# Every formatted message is HTML; bind the enum member once
+_HTML = ParseMode.HTML
+
+# Fixed message texts, shared by the command and button versions of each screen
+_MAIN_MENU_HTML = "🤖 <b>Stock Trading Bot Controller</b>\n\nSelect an option:"
+
+_WELCOME_HTML = (
+    "🤖 <b>Stock Trading Bot Controller</b>\n\n"
+    "Welcome! Use the buttons below to control your trading bot.\n\n"
+    "• Start/Stop the trading program\n"
+    "• Manage your stock watchlist\n"
+    "• View configuration and status"
+)
+
+_HELP_HTML = (
+    "❓ <b>Help &amp; Commands</b>\n\n"
+    "<b>Main Features:</b>\n"
+    "• Start/Stop - Control the trading bot\n"
+    "• Status - View bot status and stocks\n"
+    "• Stocks - Add/remove stocks from watchlist\n"
+    "• Config - View trading parameters\n\n"
+    "<b>Commands:</b>\n"
+    "/start - Show main menu\n"
+    "/menu - Return to main menu\n"
+    "/status - Quick status check\n\n"
+    "<b>Adding Stocks:</b>\n"
+    "1. Select exchange (NSE or BSE)\n"
+    "2. Enter stock name or trading symbol\n"
+    "Examples: RELIANCE, TCS, TATAMOTORS\n\n"
+    "The bot will automatically find the correct ISIN code."
+)
+
+# Authorized users as ready-made chat ids, in configured order
+_AUTH_IDS_INT = tuple(int(u) if u.lstrip('-').isdigit() else u for u in dict.fromkeys(AUTHORIZED_USERS))
+
+# Static keyboards are immutable, so build them once and share them across updates
+_MAIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("▶️ Start Bot", callback_data="start_bot"),
+        InlineKeyboardButton("⏹️ Stop Bot", callback_data="stop_bot")
+    ],
+    [
+        InlineKeyboardButton("📊 Status", callback_data="status"),
+        InlineKeyboardButton("📈 Stocks", callback_data="stocks_menu")
+    ],
+    [
+        InlineKeyboardButton("⚙️ Config", callback_data="config"),
+        InlineKeyboardButton("🔑 Token", callback_data="token_menu")
+    ],
+    [
+        InlineKeyboardButton("❓ Help", callback_data="help")
+    ]
+])
+_CANCEL_STOCKS_BTN = InlineKeyboardButton("🔙 Cancel", callback_data="stocks_menu")
+# Static rows of the token refresh keyboard, whose first row carries a per-request URL
+_AUTH_COMPLETE_ROW = (InlineKeyboardButton("✅ I've Authorized", callback_data="auth_complete"),)
+_CANCEL_TOKEN_ROW = (InlineKeyboardButton("🔙 Cancel", callback_data="token_menu"),)
+_BACK_TO_MAIN_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]])
+_BACK_TO_TOKEN_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="token_menu")]])
+_STOCKS_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("➕ Add Stock", callback_data="add_stock"),
+        InlineKeyboardButton("➖ Remove Stock", callback_data="remove_stock")
+    ],
+    [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
+])
+_EXCHANGE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("NSE", callback_data="exchange_NSE_EQ")],
+    [InlineKeyboardButton("BSE", callback_data="exchange_BSE_EQ")],
+    [_CANCEL_STOCKS_BTN]
+])
+_TOKEN_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🔄 Check Token", callback_data="check_token"),
+        InlineKeyboardButton("🔑 Refresh Token", callback_data="refresh_token")
+    ],
+    [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
+])
+
+# (.env key, label) pairs shown by the Config menu, in display order
+_CONFIG_ITEMS = (
+    ('INTERVAL', 'Candle Interval'),
+    ('EMA_LENGTH', 'EMA Length'),
+    ('VOL_LENGTH', 'Volume Length'),
+    ('VOL_MULTIPLIER', 'Volume Multiplier'),
+    ('RISK_REWARD', 'Risk/Reward Ratio'),
+    ('VWAP_DISTANCE', 'VWAP Distance'),
+    ('SL_BUFFER', 'Stop Loss Buffer'),
+    ('TRADE_START_TIME', 'Trading Start'),
+    ('TRADE_END_TIME', 'Trading End'),
+)
+
+# Abandoned add-stock / token conversations are dropped after this long
+CONVERSATION_TIMEOUT = timedelta(minutes=5)
+
+# Upper bound on updates the Application processes at the same time
+MAX_CONCURRENT_UPDATES = 256
+
+# Outgoing Bot API calls per second (Telegram allows ~30) and retries after a 429
+MAX_SEND_RATE = 25
+SEND_MAX_RETRIES = 3
+
+# Connections for Bot API calls, kept apart from the long-polling getUpdates
+# connection so a stalled poll can never starve replies (and vice versa)
+SEND_POOL_SIZE = 32
+SEND_POOL_TIMEOUT = 10.0
+GET_UPDATES_POOL_TIMEOUT = 20.0
+
+# Backoff (seconds) before re-sending a broadcast message that timed out
+SEND_RETRY_DELAYS = (0.5, 1.0, 2.0)
+
+# Worker threads for blocking calls (Upstox token checks, symbol CSV, .env) made from handlers
+BLOCKING_IO_WORKERS = 8
+
+# Seconds to wait for more watchlist edits before writing the .env
+ENV_WRITE_DELAY = 0.1
+
+class TradingState(IntEnum):
+    STOPPED = 0
+    RUNNING = 1
 
 class TradingBotController:
     def __init__(self):
-        self.env_path = Path(__file__).parent.parent / ".env"
-        self.main_script = Path(__file__).parent.parent / "core_logic" / "main.py"
-        
+        self.env_path = ENV_PATH
+        self.main_script = MAIN_SCRIPT
+        self.trading_log = TRADING_LOG
+        # Trading subprocess and its state; start/stop hold the lock so two users
+        # pressing Start at once cannot spawn two children
+        self.process = None
+        self.state = TradingState.STOPPED
+        self._state_lock = asyncio.Lock()
+        # Parsed .env keyed by (mtime_ns, size) so unchanged files cost one stat
+        self._env_cache = None
+        self._env_stat = None
+        # Resolved watchlist, reused until the .env or its SYMBOLS change
+        self._syms_cache = None
+        self._syms_cache_key = None
+        # .env key updates waiting to be written, and the task that will write them
+        self._pending_env = None
+        self._flush_task = None
+        # Held while queued updates are written, so a flush never returns while an
+        # earlier write is still in flight and two writes never overlap
+        self._flush_lock = asyncio.Lock()
+        # Guards _env_cache, _env_stat and _pending_env: read_env also runs on worker
+        # threads (status / watchlist views) while edits are queued on the event loop
+        self._env_lock = threading.Lock()
+
     def read_env(self):
         """Read .env file and return as dictionary"""
+        with self._env_lock:
+            return self._read_env_locked()
+
+    def _read_env_locked(self):
+        """read_env body; the caller holds _env_lock"""
+        # Queued edits are newer than the file, so serve them until they are flushed
+        if self._pending_env is not None:
+            return self._env_cache.copy()
+
+        try:
+            st = self.env_path.stat()
+        except FileNotFoundError:
+            self._env_cache = None
+            self._env_stat = None
+            return {}
+
+        env_stat = (st.st_mtime_ns, st.st_size)
+        if self._env_cache is not None and env_stat == self._env_stat:
+            return self._env_cache.copy()
+
+        data, st = self._read_env_bytes()
         env_vars = {}
-        if self.env_path.exists():
-            with open(self.env_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        env_vars[key.strip()] = value.strip()
-        return env_vars
-    
-    def write_env(self, env_vars):
-        """Write dictionary back to .env file"""
-        with open(self.env_path, 'w') as f:
-            for key, value in env_vars.items():
-                f.write(f"{key}={value}\n")
-    
-    def get_symbols(self):
-        """Get current list of symbols from .env"""
-        env_vars = self.read_env()
+        for line in data.decode().splitlines():
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                env_vars[key.strip()] = value.strip()
+
+        self._env_cache = env_vars
+        self._env_stat = (st.st_mtime_ns, st.st_size)
+        return env_vars.copy()
+
+    def _read_env_bytes(self):
+        """Read the whole .env in one pread, returning (bytes, stat of that fd)"""
+        fd = os.open(self.env_path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            st = os.fstat(fd)
+            return os.pread(fd, st.st_size, 0), st
+        finally:
+            os.close(fd)
+
+    def update_env_key(self, key, value):
+        """Set key=value in .env, leaving every other line untouched"""
+        self._rewrite_env({key: value})
+        # The file may also carry another writer's changes (e.g. a new token), so parse it again
+        with self._env_lock:
+            self._env_stat = None
+
+    def _rewrite_env(self, updates):
+        """
+        Stream .env into a temp file, swapping the lines for the keys in updates, then
+        atomically replace .env. Comments, blank lines and key order are kept; keys
+        missing from the file are appended.
+        """
+        pending = dict(updates)
+
+        def write_contents(out):
+            try:
+                with open(self.env_path, 'r') as f:
+                    for line in f:
+                        key = line.split('=', 1)[0].strip() if '=' in line else None
+                        if key in pending and not line.lstrip().startswith('#'):
+                            line = f"{key}={pending.pop(key)}\n"
+                        elif not line.endswith('\n'):
+                            line += '\n'
+                        out.write(line)
+            except FileNotFoundError:
+                pass
+            for key, value in pending.items():
+                out.write(f"{key}={value}\n")
+
+        # Read and replace under the shared lock, so a token refresh is never overwritten
+        with ENV_WRITE_LOCK:
+            replace_env_file(self.env_path, write_contents)
+
+    def _queue_env_update(self, key, value):
+        """Apply key=value in memory now and write it to disk shortly, coalescing bursts"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the bot's event loop there is nothing to coalesce with
+            self.update_env_key(key, value)
+            return
+
+        with self._env_lock:
+            if self._env_cache is None:
+                self._env_cache = {}
+            self._env_cache[key] = value
+            if self._pending_env is None:
+                self._pending_env = {}
+            self._pending_env[key] = value
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_env_later())
+
+    async def _flush_env_later(self):
+        """Wait for a burst of edits to settle, then write the .env once"""
+        while self._pending_env is not None:
+            await asyncio.sleep(ENV_WRITE_DELAY)
+            await self.flush_env()
+
+    async def flush_env(self):
+        """Write any queued .env edits to disk without blocking the event loop"""
+        async with self._flush_lock:
+            # The edits stay queued until they are on disk, so a read during the write
+            # still sees them rather than re-parsing the old file
+            with self._env_lock:
+                if self._pending_env is None:
+                    return
+                updates = dict(self._pending_env)
+            await asyncio.to_thread(self._rewrite_env, updates)
+            with self._env_lock:
+                # Keep only edits queued while the write was in flight
+                for key, value in updates.items():
+                    if self._pending_env.get(key) == value:
+                        del self._pending_env[key]
+                # Re-read the file once nothing newer is queued; it may carry another writer's changes
+                if not self._pending_env:
+                    self._pending_env = None
+                    self._env_stat = None
+
+    def get_symbols(self, env_vars=None):
+        """Get current list of symbols from .env (or from already-read env_vars)"""
+        if env_vars is None:
+            env_vars = self.read_env()
         symbols_str = env_vars.get('SYMBOLS', '')
         if symbols_str:
             return [s.strip() for s in symbols_str.split(',') if s.strip()]
@@ -67,30 +344,30 @@ class TradingBotController:
     def get_symbols_with_names(self):
         """Get symbols with their stock names"""
         symbols = self.get_symbols()
-        lookup = get_lookup()
+        key = (self._env_stat, tuple(symbols))
+        if self._syms_cache is not None and key == self._syms_cache_key:
+            return list(self._syms_cache)
+
+        details_map = get_lookup().parse_instrument_keys(symbols)
+        unknown = {'name': 'Unknown', 'trading_symbol': 'Unknown', 'exchange': 'Unknown'}
+
         result = []
-        
         for symbol in symbols:
-            details = lookup.parse_instrument_key(symbol)
-            if details:
-                result.append({
-                    'instrument_key': symbol,
-                    'name': details['name'],
-                    'trading_symbol': details['trading_symbol'],
-                    'exchange': details['exchange']
-                })
-            else:
-                result.append({
-                    'instrument_key': symbol,
-                    'name': 'Unknown',
-                    'trading_symbol': 'Unknown',
-                    'exchange': 'Unknown'
-                })
-        
-        return result
+            details = details_map.get(symbol, unknown)
+            result.append({
+                'instrument_key': symbol,
+                'name': details['name'],
+                'trading_symbol': details['trading_symbol'],
+                'exchange': details['exchange']
+            })
+
+        self._syms_cache = result
+        self._syms_cache_key = key
+        return list(result)
     
     def add_symbol(self, stock_name, exchange):
         """Add a new symbol to .env using stock name and exchange"""
+        self._syms_cache = None
         symbols = self.get_symbols()
         lookup = get_lookup()
         
@@ -104,116 +381,136 @@ class TradingBotController:
             return False, "Stock already exists in watchlist"
         
         symbols.append(instrument_key)
-        env_vars = self.read_env()
-        env_vars['SYMBOLS'] = ','.join(symbols)
-        self.write_env(env_vars)
+        self._queue_env_update('SYMBOLS', ','.join(symbols))
         
         return True, f"Added {stock_name} ({exchange})"
     
     def remove_symbol(self, instrument_key):
         """Remove a symbol from .env"""
+        self._syms_cache = None
         symbols = self.get_symbols()
         instrument_key = instrument_key.strip()
         
-        if instrument_key not in symbols:
+        # Drop the key in the same pass that tells us whether it was there
+        remaining = [s for s in symbols if s != instrument_key]
+        if len(remaining) == len(symbols):
             return False, "Stock not found"
         
-        # Get stock name for confirmation message
-        lookup = get_lookup()
-        details = lookup.parse_instrument_key(instrument_key)
+        # Get stock name for confirmation message (one scan of the symbol data)
+        details = get_lookup().parse_instrument_keys([instrument_key]).get(instrument_key)
         stock_name = details['name'] if details else instrument_key
         
-        symbols.remove(instrument_key)
-        env_vars = self.read_env()
-        env_vars['SYMBOLS'] = ','.join(symbols)
-        self.write_env(env_vars)
+        self._queue_env_update('SYMBOLS', ','.join(remaining))
         return True, f"Removed {stock_name}"
     
-    def start_trading(self):
+    def is_running(self):
+        """
+        Check the trading subprocess itself rather than trusting the state flag.
+        Read-only, as get_status calls it from a worker thread; start/stop reset
+        the state of an exited child under _state_lock (_reap_exited)
+        """
+        return self.process is not None and self.process.returncode is None
+
+    def _reap_exited(self):
+        """Forget a child that exited on its own; the caller holds _state_lock"""
+        if self.process is not None and self.process.returncode is not None:
+            logger.warning(f"Trading bot exited on its own with code {self.process.returncode}")
+            self.process = None
+        if self.process is None:
+            self.state = TradingState.STOPPED
+
+    async def start_trading(self):
         """Start the main trading script"""
-        global trading_process, trading_status
-        
-        if trading_status == "running":
-            return False, "Trading bot is already running"
-        
-        # Check token validity before starting
-        token_manager = get_token_manager()
-        is_valid, token_message = token_manager.check_token_validity()
-        
-        if not is_valid:
-            error_msg = f"❌ Cannot start bot: Token is expired or invalid\n\n{token_message}\n\nPlease refresh your token using the Token menu."
-            logger.error(f"Cannot start bot - token invalid: {token_message}")
-            return False, error_msg
-        
-        try:
-            # Start the main.py script as a subprocess
-            trading_process = subprocess.Popen(
-                [sys.executable, str(self.main_script)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            trading_status = "running"
-            logger.info("Trading bot started successfully")
-            return True, "✅ Trading bot started successfully"
-        except Exception as e:
-            logger.error(f"Failed to start trading bot: {e}")
-            return False, f"❌ Failed to start: {str(e)}"
-    
-    def stop_trading(self):
+        async with self._state_lock:
+            self._reap_exited()
+            if self.is_running():
+                return False, "Trading bot is already running"
+            
+            # main.py reads the .env at startup, so it must see any queued watchlist edits
+            await self.flush_env()
+            
+            # Check token validity before starting
+            token_manager = get_token_manager()
+            is_valid, token_message = await asyncio.to_thread(token_manager.check_token_validity)
+            
+            if not is_valid:
+                error_msg = f"❌ Cannot start bot: Token is expired or invalid\n\n{token_message}\n\nPlease refresh your token using the Token menu."
+                logger.error(f"Cannot start bot - token invalid: {token_message}")
+                return False, error_msg
+            
+            try:
+                # Start the main.py script as a subprocess without blocking the event loop.
+                # Its console output (warnings, prints, crash tracebacks) goes straight to a
+                # log file; the child inherits the fd, so ours can be closed right away.
+                self.trading_log.parent.mkdir(exist_ok=True)
+                with open(self.trading_log, 'ab') as log_file:
+                    self.process = await asyncio.create_subprocess_exec(
+                        sys.executable, str(self.main_script),
+                        stdout=log_file,
+                        stderr=asyncio.subprocess.STDOUT
+                    )
+                self.state = TradingState.RUNNING
+                logger.info("Trading bot started successfully")
+                return True, "✅ Trading bot started successfully"
+            except Exception as e:
+                logger.error(f"Failed to start trading bot: {e}")
+                return False, f"❌ Failed to start: {str(e)}"
+    
+    async def stop_trading(self):
         """Stop the trading script"""
-        global trading_process, trading_status
-        
-        if trading_status == "stopped":
-            return False, "Trading bot is not running"
-        
-        try:
-            if trading_process:
-                trading_process.terminate()
-                trading_process.wait(timeout=5)
-                trading_process = None
-            trading_status = "stopped"
-            logger.info("Trading bot stopped successfully")
-            return True, "🛑 Trading bot stopped successfully"
-        except Exception as e:
-            logger.error(f"Failed to stop trading bot: {e}")
-            if trading_process:
-                trading_process.kill()
-                trading_process = None
-            trading_status = "stopped"
-            return True, "🛑 Trading bot force stopped"
+        async with self._state_lock:
+            self._reap_exited()
+            if not self.is_running():
+                return False, "Trading bot is not running"
+            
+            try:
+                self.process.terminate()
+                await asyncio.wait_for(self.process.wait(), timeout=5)
+                self.process = None
+                self.state = TradingState.STOPPED
+                logger.info("Trading bot stopped successfully")
+                return True, "🛑 Trading bot stopped successfully"
+            except Exception as e:
+                logger.error(f"Failed to stop trading bot: {e}")
+                if self.process:
+                    self.process.kill()
+                    await self.process.wait()
+                    self.process = None
+                self.state = TradingState.STOPPED
+                return True, "🛑 Trading bot force stopped"
     
     def get_status(self):
         """Get current status of trading bot and configuration"""
         symbols_with_names = self.get_symbols_with_names()
         env_vars = self.read_env()
         
-        status_msg = f"🤖 <b>Trading Bot Status</b>\n\n"
-        status_msg += f"Status: {'🟢 Running' if trading_status == 'running' else '🔴 Stopped'}\n\n"
-        status_msg += f"📊 <b>Tracked Stocks ({len(symbols_with_names)}):</b>\n"
-        
-        if symbols_with_names:
-            for i, stock in enumerate(symbols_with_names, 1):
-                status_msg += f"{i}. <b>{stock['name']}</b> (<code>{stock['trading_symbol']}</code>) - {stock['exchange']}\n"
-        else:
-            status_msg += "<i>No stocks configured</i>\n"
-        
-        status_msg += f"\n⚙️ <b>Configuration:</b>\n"
-        status_msg += f"Interval: <code>{env_vars.get('INTERVAL', '1m')}</code>\n"
-        status_msg += f"EMA Length: <code>{env_vars.get('EMA_LENGTH', '200')}</code>\n"
-        status_msg += f"Risk/Reward: <code>{env_vars.get('RISK_REWARD', '1.6')}</code>\n"
-        
-        return status_msg
+        return (
+            "🤖 <b>Trading Bot Status</b>\n\n"
+            f"Status: {'🟢 Running' if self.is_running() else '🔴 Stopped'}\n\n"
+            f"📊 <b>Tracked Stocks ({len(symbols_with_names)}):</b>\n"
+            f"{format_stock_lines(symbols_with_names)}"
+            "\n⚙️ <b>Configuration:</b>\n"
+            f"Interval: <code>{env_vars.get('INTERVAL', '1m')}</code>\n"
+            f"EMA Length: <code>{env_vars.get('EMA_LENGTH', '200')}</code>\n"
+            f"Risk/Reward: <code>{env_vars.get('RISK_REWARD', '1.6')}</code>\n"
+        )
+
+def format_stock_lines(symbols_with_names):
+    """Render the numbered watchlist used by the status and stocks screens"""
+    if not symbols_with_names:
+        return "<i>No stocks configured</i>\n"
+    return "".join(
+        f"{i}. <b>{stock['name']}</b> (<code>{stock['trading_symbol']}</code>) - {stock['exchange']}\n"
+        for i, stock in enumerate(symbols_with_names, 1)
+    )
 
 # Initialize controller
 controller = TradingBotController()
 
 def is_authorized(user_id):
     """Check if user is authorized to use the bot"""
-    if not AUTHORIZED_USERS:
-        logger.warning("No authorized users configured!")
-        return False
-    return str(user_id) in AUTHORIZED_USERS
+    # main() refuses to start without AUTHORIZED_USERS, so no per-call emptiness check
+    return user_id in AUTHORIZED_USER_IDS
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command - show main menu"""
@@ -223,302 +520,238 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ You are not authorized to use this bot.")
         return
     
-    keyboard = [
-        [
-            InlineKeyboardButton("▶️ Start Bot", callback_data="start_bot"),
-            InlineKeyboardButton("⏹️ Stop Bot", callback_data="stop_bot")
-        ],
-        [
-            InlineKeyboardButton("📊 Status", callback_data="status"),
-            InlineKeyboardButton("📈 Stocks", callback_data="stocks_menu")
-        ],
-        [
-            InlineKeyboardButton("⚙️ Config", callback_data="config"),
-            InlineKeyboardButton("🔑 Token", callback_data="token_menu")
-        ],
-        [
-            InlineKeyboardButton("❓ Help", callback_data="help")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     
-    welcome_msg = (
-        "🤖 <b>Stock Trading Bot Controller</b>\n\n"
-        "Welcome! Use the buttons below to control your trading bot.\n\n"
-        "• Start/Stop the trading program\n"
-        "• Manage your stock watchlist\n"
-        "• View configuration and status"
+    await update.message.reply_text(_WELCOME_HTML, reply_markup=_MAIN_MENU_MARKUP, parse_mode=_HTML)
+
+async def _h_start_bot(query, context):
+    """Start the trading program"""
+    success, message = await controller.start_trading()
+    await query.edit_message_text(
+        f"{message}\n\nUse /menu to return to main menu."
     )
-    
-    await update.message.reply_text(welcome_msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle button callbacks"""
-    query = update.callback_query
-    user_id = query.from_user.id
+async def _h_stop_bot(query, context):
+    """Stop the trading program"""
+    success, message = await controller.stop_trading()
+    await query.edit_message_text(
+        f"{message}\n\nUse /menu to return to main menu."
+    )
+
+async def _h_status(query, context):
+    """Show bot status and tracked stocks"""
+    status_msg = await asyncio.to_thread(controller.get_status)
+    await query.edit_message_text(status_msg, reply_markup=_BACK_TO_MAIN_MARKUP, parse_mode=_HTML)
+
+async def _h_stocks_menu(query, context):
+    """Show the stock management menu"""
+    symbols_with_names = await asyncio.to_thread(controller.get_symbols_with_names)
+    msg = (
+        "📈 <b>Stock Management</b>\n\n"
+        f"Current stocks ({len(symbols_with_names)}):\n"
+        f"{format_stock_lines(symbols_with_names)}"
+    )
     
-    if not is_authorized(user_id):
-        await query.answer("❌ Not authorized", show_alert=True)
+    await query.edit_message_text(msg, reply_markup=_STOCKS_MENU_MARKUP, parse_mode=_HTML)
+
+async def _h_add_stock(query, context):
+    """Ask which exchange to add a stock on"""
+    await query.edit_message_text(
+        "➕ <b>Add New Stock</b>\n\n"
+        "First, select the exchange:",
+        reply_markup=_EXCHANGE_MARKUP,
+        parse_mode=_HTML
+    )
+    return
+
+async def _h_exchange(query, context):
+    """Remember the exchange and ask for the stock name"""
+    exchange = query.data.replace("exchange_", "")
+    context.user_data['selected_exchange'] = exchange
+    await query.edit_message_text(
+        f"➕ <b>Add New Stock - {exchange}</b>\n\n"
+        f"Now, send the stock name or trading symbol.\n\n"
+        f"<b>Examples:</b>\n"
+        f"• RELIANCE\n"
+        f"• TCS\n"
+        f"• TATAMOTORS\n"
+        f"• Infosys\n\n"
+        f"Or send /cancel to go back.",
+        parse_mode=_HTML
+    )
+    return ADDING_STOCK
+
+async def _h_remove_stock(query, context):
+    """List tracked stocks for removal"""
+    symbols_with_names = await asyncio.to_thread(controller.get_symbols_with_names)
+    if not symbols_with_names:
+        await query.edit_message_text(
+            "No stocks to remove.\n\nUse /menu to return."
+        )
         return ConversationHandler.END
     
-    await query.answer()
+    keyboard = [
+        [InlineKeyboardButton(f"❌ {stock['name']} ({stock['trading_symbol']})",
+                              callback_data=f"rm_{stock['instrument_key']}")]
+        for stock in symbols_with_names
+    ]
+    keyboard.append([_CANCEL_STOCKS_BTN])
     
-    data = query.data
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await query.edit_message_text(
+        "➖ <b>Remove Stock</b>\n\nSelect a stock to remove:",
+        reply_markup=reply_markup,
+        parse_mode=_HTML
+    )
+
+async def _h_rm(query, context):
+    """Remove the selected stock"""
+    symbol = query.data[3:]
+    success, message = controller.remove_symbol(symbol)
     
-    if data == "start_bot":
-        success, message = controller.start_trading()
+    if success:
         await query.edit_message_text(
-            f"{message}\n\nUse /menu to return to main menu."
+            f"✅ {message}\n\nUse /menu to return to main menu."
         )
-    
-    elif data == "stop_bot":
-        success, message = controller.stop_trading()
+    else:
         await query.edit_message_text(
-            f"{message}\n\nUse /menu to return to main menu."
+            f"❌ {message}\n\nUse /menu to return to main menu."
         )
+
+async def _h_config(query, context):
+    """Show the current configuration"""
+    env_vars = controller.read_env()
+    msg = "⚙️ <b>Current Configuration</b>\n\n" + "".join(
+        f"• {label}: <code>{env_vars.get(key, 'Not set')}</code>\n"
+        for key, label in _CONFIG_ITEMS
+    )
     
-    elif data == "status":
-        status_msg = controller.get_status()
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(status_msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    await query.edit_message_text(msg, reply_markup=_BACK_TO_MAIN_MARKUP, parse_mode=_HTML)
+
+async def _h_help(query, context):
+    """Show help text"""
+    await query.edit_message_text(_HELP_HTML, reply_markup=_BACK_TO_MAIN_MARKUP, parse_mode=_HTML)
+
+async def _h_main_menu(query, context):
+    """Show the main menu"""
+    await query.edit_message_text(
+        _MAIN_MENU_HTML,
+        reply_markup=_MAIN_MENU_MARKUP,
+        parse_mode=_HTML
+    )
+
+async def _h_token_menu(query, context):
+    """Show Upstox token status"""
+    token_manager = get_token_manager()
+    token_info = await asyncio.to_thread(token_manager.get_token_info)
     
-    elif data == "stocks_menu":
-        symbols_with_names = controller.get_symbols_with_names()
-        msg = f"📈 <b>Stock Management</b>\n\n"
-        msg += f"Current stocks ({len(symbols_with_names)}):\n"
-        
-        if symbols_with_names:
-            for i, stock in enumerate(symbols_with_names, 1):
-                msg += f"{i}. <b>{stock['name']}</b> (<code>{stock['trading_symbol']}</code>) - {stock['exchange']}\n"
-        else:
-            msg += "<i>No stocks configured</i>\n"
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("➕ Add Stock", callback_data="add_stock"),
-                InlineKeyboardButton("➖ Remove Stock", callback_data="remove_stock")
-            ],
-            [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
-    
-    elif data == "add_stock":
-        keyboard = [
-            [InlineKeyboardButton("NSE", callback_data="exchange_NSE_EQ")],
-            [InlineKeyboardButton("BSE", callback_data="exchange_BSE_EQ")],
-            [InlineKeyboardButton("🔙 Cancel", callback_data="stocks_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "➕ <b>Add New Stock</b>\n\n"
-            "First, select the exchange:",
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.HTML
-        )
+    status_icon = "✅" if token_info['is_valid'] else "❌"
+    refresh_hint = "" if token_info['is_valid'] else (
+        "⚠️ <b>Token needs refresh!</b>\n"
+        "Click 'Check Token' to verify or 'Refresh Token' to update.\n"
+    )
+    msg = (
+        "🔑 <b>Upstox Token Status</b>\n\n"
+        f"Status: {status_icon} {token_info['message']}\n"
+        f"Last Checked: {token_info['checked_at']}\n\n"
+        f"{refresh_hint}"
+    )
+    
+    await query.edit_message_text(msg, reply_markup=_TOKEN_MENU_MARKUP, parse_mode=_HTML)
+
+async def _h_check_token(query, context):
+    """Re-check Upstox token validity"""
+    token_manager = get_token_manager()
+    is_valid, message = await asyncio.to_thread(token_manager.check_token_validity, force=True)
+    
+    status_icon = "✅" if is_valid else "❌"
+    msg = (
+        "🔑 <b>Token Check Result</b>\n\n"
+        f"{status_icon} {message}\n\n"
+        f"Checked at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    )
+    
+    await query.edit_message_text(msg, reply_markup=_BACK_TO_TOKEN_MARKUP, parse_mode=_HTML)
+
+async def _h_refresh_token(query, context):
+    """Start the Upstox token refresh flow"""
+    token_manager = get_token_manager()
+    auth_url = token_manager.get_authorization_url()
+    
+    if not auth_url:
+        msg = "❌ <b>Error</b>\n\nMissing Upstox credentials in .env file."
+        await query.edit_message_text(msg, reply_markup=_BACK_TO_TOKEN_MARKUP, parse_mode=_HTML)
         return
     
-    elif data.startswith("exchange_"):
-        exchange = data.replace("exchange_", "")
-        context.user_data['selected_exchange'] = exchange
-        await query.edit_message_text(
-            f"➕ <b>Add New Stock - {exchange}</b>\n\n"
-            f"Now, send the stock name or trading symbol.\n\n"
-            f"<b>Examples:</b>\n"
-            f"• RELIANCE\n"
-            f"• TCS\n"
-            f"• TATAMOTORS\n"
-            f"• Infosys\n\n"
-            f"Or send /cancel to go back.",
-            parse_mode=ParseMode.HTML
-        )
-        return ADDING_STOCK
+    # Create clickable button with the auth URL
+    keyboard = [
+        [InlineKeyboardButton("🔐 Login to Upstox", url=auth_url)],
+        _AUTH_COMPLETE_ROW,
+        _CANCEL_TOKEN_ROW
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
     
-    elif data == "remove_stock":
-        symbols_with_names = controller.get_symbols_with_names()
-        if not symbols_with_names:
-            await query.edit_message_text(
-                "No stocks to remove.\n\nUse /menu to return."
-            )
-            return ConversationHandler.END
-        
-        keyboard = []
-        for stock in symbols_with_names:
-            button_text = f"❌ {stock['name']} ({stock['trading_symbol']})"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"rm_{stock['instrument_key']}")])
-        keyboard.append([InlineKeyboardButton("🔙 Cancel", callback_data="stocks_menu")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "➖ <b>Remove Stock</b>\n\nSelect a stock to remove:",
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.HTML
-        )
+    msg = (
+        "🔑 <b>Token Refresh Process</b>\n\n"
+        "<b>Step 1:</b> Click the 'Login to Upstox' button below\n"
+        "<b>Step 2:</b> Enter OTP and authorize the app\n"
+        "<b>Step 3:</b> Copy the authorization code from the redirect URL\n"
+        "<b>Step 4:</b> Click 'I've Authorized' and paste the code\n\n"
+        "The redirect URL will look like:\n"
+        "<code>http://your-redirect-uri/?code=XXXXX</code>\n\n"
+        "Copy only the code part (after <code>code=</code>)"
+    )
     
-    elif data.startswith("rm_"):
-        symbol = data[3:]
-        success, message = controller.remove_symbol(symbol)
-        
-        if success:
-            await query.edit_message_text(
-                f"✅ {message}\n\nUse /menu to return to main menu."
-            )
-        else:
-            await query.edit_message_text(
-                f"❌ {message}\n\nUse /menu to return to main menu."
-            )
+    await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode=_HTML)
+
+async def _h_auth_complete(query, context):
+    """Ask for the authorization code"""
+    msg = (
+        "📝 <b>Enter Authorization Code</b>\n\n"
+        "Please send the authorization code you received from the redirect URL.\n\n"
+        "Example: If the URL is:\n"
+        "<code>http://localhost/?code=abc123xyz</code>\n\n"
+        "Send: <code>abc123xyz</code>\n\n"
+        "Or send /cancel to abort."
+    )
+    await query.edit_message_text(msg, parse_mode=_HTML)
+    return WAITING_AUTH_CODE
+
+# Exact callback_data -> handler; prefixed callbacks carry a payload after the prefix
+_HANDLERS = {
+    "start_bot": _h_start_bot,
+    "stop_bot": _h_stop_bot,
+    "status": _h_status,
+    "stocks_menu": _h_stocks_menu,
+    "add_stock": _h_add_stock,
+    "remove_stock": _h_remove_stock,
+    "config": _h_config,
+    "help": _h_help,
+    "main_menu": _h_main_menu,
+    "token_menu": _h_token_menu,
+    "check_token": _h_check_token,
+    "refresh_token": _h_refresh_token,
+    "auth_complete": _h_auth_complete,
+}
+_PREFIX_HANDLERS = (("exchange_", _h_exchange), ("rm_", _h_rm))
+
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle button callbacks"""
+    query = update.callback_query
+    user_id = query.from_user.id
     
-    elif data == "config":
-        env_vars = controller.read_env()
-        msg = "⚙️ <b>Current Configuration</b>\n\n"
-        
-        config_items = {
-            'INTERVAL': 'Candle Interval',
-            'EMA_LENGTH': 'EMA Length',
-            'VOL_LENGTH': 'Volume Length',
-            'VOL_MULTIPLIER': 'Volume Multiplier',
-            'RISK_REWARD': 'Risk/Reward Ratio',
-            'VWAP_DISTANCE': 'VWAP Distance',
-            'SL_BUFFER': 'Stop Loss Buffer',
-            'TRADE_START_TIME': 'Trading Start',
-            'TRADE_END_TIME': 'Trading End'
-        }
-        
-        for key, label in config_items.items():
-            value = env_vars.get(key, 'Not set')
-            msg += f"• {label}: <code>{value}</code>\n"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
-    
-    elif data == "help":
-        help_msg = (
-            "❓ <b>Help &amp; Commands</b>\n\n"
-            "<b>Main Features:</b>\n"
-            "• Start/Stop - Control the trading bot\n"
-            "• Status - View bot status and stocks\n"
-            "• Stocks - Add/remove stocks from watchlist\n"
-            "• Config - View trading parameters\n\n"
-            "<b>Commands:</b>\n"
-            "/start - Show main menu\n"
-            "/menu - Return to main menu\n"
-            "/status - Quick status check\n\n"
-            "<b>Adding Stocks:</b>\n"
-            "1. Select exchange (NSE or BSE)\n"
-            "2. Enter stock name or trading symbol\n"
-            "Examples: RELIANCE, TCS, TATAMOTORS\n\n"
-            "The bot will automatically find the correct ISIN code."
-        )
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(help_msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
-    
-    elif data == "main_menu":
-        keyboard = [
-            [
-                InlineKeyboardButton("▶️ Start Bot", callback_data="start_bot"),
-                InlineKeyboardButton("⏹️ Stop Bot", callback_data="stop_bot")
-            ],
-            [
-                InlineKeyboardButton("📊 Status", callback_data="status"),
-                InlineKeyboardButton("📈 Stocks", callback_data="stocks_menu")
-            ],
-            [
-                InlineKeyboardButton("⚙️ Config", callback_data="config"),
-                InlineKeyboardButton("🔑 Token", callback_data="token_menu")
-            ],
-            [
-                InlineKeyboardButton("❓ Help", callback_data="help")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "🤖 <b>Stock Trading Bot Controller</b>\n\nSelect an option:",
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.HTML
-        )
+    if not is_authorized(user_id):
+        await query.answer("❌ Not authorized", show_alert=True)
+        return ConversationHandler.END
     
-    elif data == "token_menu":
-        token_manager = get_token_manager()
-        token_info = token_manager.get_token_info()
-        
-        status_icon = "✅" if token_info['is_valid'] else "❌"
-        msg = f"🔑 <b>Upstox Token Status</b>\n\n"
-        msg += f"Status: {status_icon} {token_info['message']}\n"
-        msg += f"Last Checked: {token_info['checked_at']}\n\n"
-        
-        if not token_info['is_valid']:
-            msg += "⚠️ <b>Token needs refresh!</b>\n"
-            msg += "Click 'Check Token' to verify or 'Refresh Token' to update.\n"
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🔄 Check Token", callback_data="check_token"),
-                InlineKeyboardButton("🔑 Refresh Token", callback_data="refresh_token")
-            ],
-            [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
-    
-    elif data == "check_token":
-        token_manager = get_token_manager()
-        is_valid, message = token_manager.check_token_validity()
-        
-        status_icon = "✅" if is_valid else "❌"
-        msg = f"🔑 <b>Token Check Result</b>\n\n"
-        msg += f"{status_icon} {message}\n\n"
-        msg += f"Checked at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="token_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    await query.answer()
     
-    elif data == "refresh_token":
-        token_manager = get_token_manager()
-        auth_url = token_manager.get_authorization_url()
-        
-        if not auth_url:
-            msg = "❌ <b>Error</b>\n\nMissing Upstox credentials in .env file."
-            keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="token_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
-            return
-        
-        # Create clickable button with the auth URL
-        keyboard = [
-            [InlineKeyboardButton("🔐 Login to Upstox", url=auth_url)],
-            [InlineKeyboardButton("✅ I've Authorized", callback_data="auth_complete")],
-            [InlineKeyboardButton("🔙 Cancel", callback_data="token_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        msg = (
-            "🔑 <b>Token Refresh Process</b>\n\n"
-            "<b>Step 1:</b> Click the 'Login to Upstox' button below\n"
-            "<b>Step 2:</b> Enter OTP and authorize the app\n"
-            "<b>Step 3:</b> Copy the authorization code from the redirect URL\n"
-            "<b>Step 4:</b> Click 'I've Authorized' and paste the code\n\n"
-            "The redirect URL will look like:\n"
-            "<code>http://your-redirect-uri/?code=XXXXX</code>\n\n"
-            "Copy only the code part (after <code>code=</code>)"
-        )
-        
-        await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
-    
-    elif data == "auth_complete":
-        msg = (
-            "📝 <b>Enter Authorization Code</b>\n\n"
-            "Please send the authorization code you received from the redirect URL.\n\n"
-            "Example: If the URL is:\n"
-            "<code>http://localhost/?code=abc123xyz</code>\n\n"
-            "Send: <code>abc123xyz</code>\n\n"
-            "Or send /cancel to abort."
-        )
-        await query.edit_message_text(msg, parse_mode=ParseMode.HTML)
-        return WAITING_AUTH_CODE
+    data = query.data
+    handler = _HANDLERS.get(data)
+    if handler:
+        return await handler(query, context)
+    for prefix, handler in _PREFIX_HANDLERS:
+        if data.startswith(prefix):
+            return await handler(query, context)
 
 async def add_stock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle adding a new stock"""
@@ -541,11 +774,7 @@ async def add_stock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Search for the stock first
     lookup = get_lookup()
-    search_results = lookup.search_stocks(stock_name, limit=5)
-    
-    # Filter by exchange
-    exchange_clean = exchange.replace('_EQ', '')
-    filtered_results = [r for r in search_results if r['exchange'].upper() == exchange_clean.upper()]
+    filtered_results = await asyncio.to_thread(lookup.search_stocks, stock_name, limit=5, exchange=exchange)
     
     logger.info(f"Stock search: '{stock_name}' on {exchange}, found {len(filtered_results)} results")
     
@@ -553,7 +782,7 @@ async def add_stock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             f"❌ Stock '{stock_name}' not found on {exchange}.\n\n"
             f"Please check the spelling and try again, or send /cancel to go back.",
-            parse_mode=ParseMode.HTML
+            parse_mode=_HTML
         )
         return ADDING_STOCK
     
@@ -569,7 +798,7 @@ async def add_stock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Symbol: <code>{selected_stock['trading_symbol']}</code>\n"
             f"Exchange: {exchange}\n\n"
             f"Use /menu to return to main menu.",
-            parse_mode=ParseMode.HTML
+            parse_mode=_HTML
         )
     else:
         await update.message.reply_text(
@@ -588,6 +817,16 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
+async def conversation_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Tell the user an abandoned conversation has expired"""
+    context.user_data.pop('selected_exchange', None)
+    if update.effective_chat:
+        await context.bot.send_message(
+            update.effective_chat.id,
+            "⌛ Session expired. Use /menu to restart."
+        )
+    return ConversationHandler.END
+
 async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show main menu"""
     user_id = update.effective_user.id
@@ -596,29 +835,11 @@ async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Not authorized")
         return
     
-    keyboard = [
-        [
-            InlineKeyboardButton("▶️ Start Bot", callback_data="start_bot"),
-            InlineKeyboardButton("⏹️ Stop Bot", callback_data="stop_bot")
-        ],
-        [
-            InlineKeyboardButton("📊 Status", callback_data="status"),
-            InlineKeyboardButton("📈 Stocks", callback_data="stocks_menu")
-        ],
-        [
-            InlineKeyboardButton("⚙️ Config", callback_data="config"),
-            InlineKeyboardButton("🔑 Token", callback_data="token_menu")
-        ],
-        [
-            InlineKeyboardButton("❓ Help", callback_data="help")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.message.reply_text(
-        "🤖 <b>Stock Trading Bot Controller</b>\n\nSelect an option:",
-        reply_markup=reply_markup,
-        parse_mode=ParseMode.HTML
+        _MAIN_MENU_HTML,
+        reply_markup=_MAIN_MENU_MARKUP,
+        parse_mode=_HTML
     )
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -629,8 +850,8 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Not authorized")
         return
     
-    status_msg = controller.get_status()
-    await update.message.reply_text(status_msg, parse_mode=ParseMode.HTML)
+    status_msg = await asyncio.to_thread(controller.get_status)
+    await update.message.reply_text(status_msg, parse_mode=_HTML)
 
 async def refresh_token_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Trigger token refresh process"""
@@ -646,7 +867,7 @@ async def refresh_token_command(update: Update, context: ContextTypes.DEFAULT_TY
     if not auth_url:
         await update.message.reply_text(
             "❌ <b>Error</b>\n\nMissing Upstox credentials in .env file.",
-            parse_mode=ParseMode.HTML
+            parse_mode=_HTML
         )
         return
     
@@ -658,7 +879,7 @@ async def refresh_token_command(update: Update, context: ContextTypes.DEFAULT_TY
         "Click the button below to login to Upstox in your browser.\n\n"
         "After authorizing, copy the code from the redirect URL and send it back here.",
         reply_markup=reply_markup,
-        parse_mode=ParseMode.HTML
+        parse_mode=_HTML
     )
 
 async def handle_auth_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -671,23 +892,23 @@ async def handle_auth_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     auth_code = update.message.text.strip()
     
-    await update.message.reply_text("🔄 <b>Processing...</b>\n\nExchanging code for access token...", parse_mode=ParseMode.HTML)
+    await update.message.reply_text("🔄 <b>Processing...</b>\n\nExchanging code for access token...", parse_mode=_HTML)
     
     token_manager = get_token_manager()
-    success, message, token = token_manager.exchange_code_for_token(auth_code)
+    success, message, token = await asyncio.to_thread(token_manager.exchange_code_for_token, auth_code)
     
     if success:
         await update.message.reply_text(
             f"✅ <b>Success!</b>\n\n{message}\n\n"
             f"Your Upstox access token has been updated.\n\n"
             f"Use /menu to return to main menu.",
-            parse_mode=ParseMode.HTML
+            parse_mode=_HTML
         )
     else:
         await update.message.reply_text(
             f"❌ <b>Failed</b>\n\n{message}\n\n"
             f"Please try again with /refresh_token",
-            parse_mode=ParseMode.HTML
+            parse_mode=_HTML
         )
     
     return ConversationHandler.END
@@ -700,33 +921,41 @@ async def send_startup_message(app):
         "Use /start to access the main menu."
     )
     
-    for user_id in AUTHORIZED_USERS:
-        try:
-            await app.bot.send_message(
-                chat_id=user_id,
-                text=startup_msg,
-                parse_mode=ParseMode.HTML
-            )
+    results = await _broadcast(app, startup_msg)
+    for user_id, result in zip(_AUTH_IDS_INT, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send startup message to user {user_id}: {result}")
+        else:
             logger.info(f"Startup message sent to user {user_id}")
-        except Exception as e:
-            logger.error(f"Failed to send startup message to user {user_id}: {e}")
 
 async def notify_users(app, message):
     """Send notification to all authorized users"""
-    for user_id in AUTHORIZED_USERS:
+    results = await _broadcast(app, message)
+    for user_id, result in zip(_AUTH_IDS_INT, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send notification to user {user_id}: {result}")
+
+async def _broadcast(app, text):
+    """Send text to every authorized user concurrently, returning per-user results"""
+    return await asyncio.gather(
+        *(_send_with_retry(app.bot, user_id, text) for user_id in _AUTH_IDS_INT),
+        return_exceptions=True
+    )
+
+async def _send_with_retry(bot, chat_id, text):
+    """send_message, retried with backoff when the request times out"""
+    for delay in SEND_RETRY_DELAYS:
         try:
-            await app.bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode=ParseMode.HTML
-            )
-        except Exception as e:
-            logger.error(f"Failed to send notification to user {user_id}: {e}")
+            return await bot.send_message(chat_id=chat_id, text=text, parse_mode=_HTML)
+        except TimedOut:
+            logger.warning(f"Sending to {chat_id} timed out, retrying in {delay}s")
+            await asyncio.sleep(delay)
+    return await bot.send_message(chat_id=chat_id, text=text, parse_mode=_HTML)
 
 async def check_token_daily(context: ContextTypes.DEFAULT_TYPE):
     """Check Upstox token validity daily"""
     token_manager = get_token_manager()
-    is_valid, message = token_manager.check_token_validity()
+    is_valid, message = await asyncio.to_thread(token_manager.check_token_validity, force=True)
     
     logger.info(f"Daily token check: {message}")
     
@@ -742,9 +971,7 @@ async def check_token_daily(context: ContextTypes.DEFAULT_TYPE):
 async def cleanup_database(context: ContextTypes.DEFAULT_TYPE):
     """Delete old database and create a new one at the start of each day"""
     try:
-        # Get the database path from the root folder
-        root_folder = Path(__file__).parent.parent
-        db_path = root_folder / 'market_data.db'
+        db_path = MARKET_DB
         
         # Check if database exists and delete it
         if db_path.exists():
@@ -770,50 +997,43 @@ async def cleanup_database(context: ContextTypes.DEFAULT_TYPE):
         )
         await notify_users(context.application, error_msg)
 
-async def check_trading_hours(context: ContextTypes.DEFAULT_TYPE):
-    """Check if it's time to start or stop trading"""
-    global trading_status
+async def auto_start_trading(context: ContextTypes.DEFAULT_TYPE):
+    """Start trading at TRADE_START_TIME"""
+    if controller.is_running():
+        return
     
+    success, message = await controller.start_trading()
+    if success:
+        logger.info("Auto-started trading bot at market open")
+        await notify_users(context.application, 
+            f"⏰ <b>Auto-Start</b>\n\n{message}\n\nMarket hours have begun.")
+    else:
+        # Token validation failed - notify users
+        logger.warning(f"Failed to auto-start trading bot: {message}")
+        await notify_users(context.application,
+            f"⚠️ <b>Auto-Start Failed</b>\n\n{message}")
+
+async def auto_stop_trading(context: ContextTypes.DEFAULT_TYPE):
+    """Stop trading at TRADE_END_TIME"""
+    if not controller.is_running():
+        return
+    
+    success, message = await controller.stop_trading()
+    if success:
+        logger.info("Auto-stopped trading bot at market close")
+        await notify_users(context.application,
+            f"⏰ <b>Auto-Stop</b>\n\n{message}\n\nMarket hours have ended.")
+
+async def check_trading_hours(context: ContextTypes.DEFAULT_TYPE):
+    """Stop the trading bot if it is running outside trading hours"""
     now = datetime.now()
     current_time = now.hour * 100 + now.minute
     
-    # Convert TRADE_START_TIME and TRADE_END_TIME to comparable format
-    # e.g., 915 -> 9:15, 1525 -> 15:25
-    start_hour = TRADE_START_TIME // 100
-    start_min = TRADE_START_TIME % 100
-    end_hour = TRADE_END_TIME // 100
-    end_min = TRADE_END_TIME % 100
+    # TRADE_START_TIME / TRADE_END_TIME are HHMM, e.g. 915 -> 9:15, 1525 -> 15:25
+    is_trading_hours = TRADE_START_TIME <= current_time <= TRADE_END_TIME
     
-    start_time = start_hour * 100 + start_min
-    end_time = end_hour * 100 + end_min
-    
-    # Check if within trading hours
-    is_trading_hours = start_time <= current_time <= end_time
-    
-    # Auto-start at trading start time
-    if current_time == start_time and trading_status == "stopped":
-        success, message = controller.start_trading()
-        if success:
-            logger.info("Auto-started trading bot at market open")
-            await notify_users(context.application, 
-                f"⏰ <b>Auto-Start</b>\n\n{message}\n\nMarket hours have begun.")
-        else:
-            # Token validation failed - notify users
-            logger.warning(f"Failed to auto-start trading bot: {message}")
-            await notify_users(context.application,
-                f"⚠️ <b>Auto-Start Failed</b>\n\n{message}")
-    
-    # Auto-stop at trading end time
-    elif current_time == end_time and trading_status == "running":
-        success, message = controller.stop_trading()
-        if success:
-            logger.info("Auto-stopped trading bot at market close")
-            await notify_users(context.application,
-                f"⏰ <b>Auto-Stop</b>\n\n{message}\n\nMarket hours have ended.")
-    
-    # Also stop if running outside trading hours
-    elif not is_trading_hours and trading_status == "running":
-        success, message = controller.stop_trading()
+    if not is_trading_hours and controller.is_running():
+        success, message = await controller.stop_trading()
         if success:
             logger.info("Auto-stopped trading bot (outside trading hours)")
             await notify_users(context.application,
@@ -831,8 +1051,26 @@ def main():
         print("Error: AUTHORIZED_USERS not set in .env file")
         return
     
+    # run_polling creates its loop from the installed policy
+    if uvloop is not None and sys.platform != "win32":
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
     # Create application
-    app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    # Updates from different chats are handled side by side, so one slow click
+    # (token check, starting main.py) does not hold up everyone else. Outgoing
+    # calls are queued under Telegram's flood limits instead of bouncing off 429s,
+    # and share HTTP/2 connections to api.telegram.org when h2 is installed.
+    app = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .http_version(_BOT_HTTP_VERSION)
+        .connection_pool_size(SEND_POOL_SIZE)
+        .pool_timeout(SEND_POOL_TIMEOUT)
+        .get_updates_pool_timeout(GET_UPDATES_POOL_TIMEOUT)
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .rate_limiter(AIORateLimiter(overall_max_rate=MAX_SEND_RATE, max_retries=SEND_MAX_RETRIES))
+        .build()
+    )
     
     # Conversation handler for adding stocks
     stock_conv_handler = ConversationHandler(
@@ -845,8 +1083,10 @@ def main():
                 MessageHandler(filters.TEXT & ~filters.COMMAND, add_stock_handler),
                 CallbackQueryHandler(button_handler, pattern="^exchange_")
             ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        conversation_timeout=CONVERSATION_TIMEOUT,
         per_message=False,
         per_chat=True,
         per_user=True,
@@ -862,8 +1102,10 @@ def main():
             WAITING_AUTH_CODE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_auth_code)
             ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        conversation_timeout=CONVERSATION_TIMEOUT,
         per_message=False,
         per_chat=True,
         per_user=True,
@@ -885,8 +1127,18 @@ def main():
     
     # Set up job queue for scheduled tasks
     if app.job_queue:
-        # Check trading hours every minute
-        app.job_queue.run_repeating(check_trading_hours, interval=60, first=10)
+        # Start and stop exactly at the configured HHMM times (local clock, as before)
+        local_tz = datetime.now().astimezone().tzinfo
+        app.job_queue.run_daily(
+            auto_start_trading,
+            time=dt_time(TRADE_START_TIME // 100, TRADE_START_TIME % 100, tzinfo=local_tz)
+        )
+        app.job_queue.run_daily(
+            auto_stop_trading,
+            time=dt_time(TRADE_END_TIME // 100, TRADE_END_TIME % 100, tzinfo=local_tz)
+        )
+        # Hourly safety net in case the bot was started outside trading hours
+        app.job_queue.run_repeating(check_trading_hours, interval=3600, first=10)
         logger.info("Scheduled auto-start/stop based on trading hours")
         
         # Clean up database daily at 12:01 AM
@@ -908,9 +1160,18 @@ def main():
     # Initialize the app first
     async def post_init(application):
         """Send startup message after bot initialization"""
+        # Bound the threads used by asyncio.to_thread for token checks and CSV/.env reads
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="bot-io")
+        )
         await send_startup_message(application)
     
+    async def post_shutdown(application):
+        """Write any queued .env edits before the process exits"""
+        await controller.flush_env()
+    
     app.post_init = post_init
+    app.post_shutdown = post_shutdown
     
     app.run_polling(allowed_updates=Update.ALL_TYPES)
 
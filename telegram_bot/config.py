@@ -11,6 +11,8 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 AUTHORIZED_USERS = os.getenv("AUTHORIZED_USERS", "").split(",")
 AUTHORIZED_USERS = [uid.strip() for uid in AUTHORIZED_USERS if uid.strip()]
+# Telegram user ids arrive as ints, so match them against ints without a str() per update
+AUTHORIZED_USER_IDS = frozenset(int(uid) for uid in AUTHORIZED_USERS if uid.lstrip('-').isdigit())
 
 # Parse chat IDs for sending alerts (can be multiple recipients)
 TELEGRAM_CHAT_IDS = os.getenv("TELEGRAM_CHAT_IDS", "")
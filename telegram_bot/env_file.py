@@ -0,0 +1,41 @@
+"""
+Env File
+Atomic, serialised rewrites of the project's .env, shared by the bot controller
+(watchlist edits) and the token manager (access token refresh)
+"""
+import os
+import tempfile
+import threading
+
+# Held for the whole read-modify-write of .env, so one writer never streams a copy
+# of the file that another is about to replace (e.g. a token refresh racing a
+# watchlist flush, both running in worker threads)
+ENV_WRITE_LOCK = threading.Lock()
+
+
+def replace_env_file(env_path, write_contents):
+    """
+    Atomically replace env_path with a new file
+
+    Args:
+        env_path: Path of the .env file
+        write_contents: Callable given the open temp file (text mode) to write into
+
+    The temp file is unique to this call and sits next to env_path, so os.replace
+    stays on one filesystem and concurrent writers never share a scratch file.
+    Callers should hold ENV_WRITE_LOCK across reading the old file and this call.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(env_path)),
+                                    prefix=".env.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            write_contents(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, env_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
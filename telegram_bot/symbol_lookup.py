@@ -3,26 +3,128 @@ Symbol Lookup Utility
 Provides functions to convert between stock names and ISIN codes
 """
 import csv
+import os
+import pickle
+import threading
+from bisect import bisect_right
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, NamedTuple, Optional
+
+SYMBOLS_CSV = Path(__file__).resolve().parent.parent / "bin" / "Final_symbols.csv"
+
+
+class SymbolRow(NamedTuple):
+    """One CSV row, with the upper-cased fields the searches compare against"""
+    exchange: str
+    name: str
+    trading_symbol: str
+    isin: str
+    exchange_upper: str
+    name_upper: str
+    symbol_upper: str
 
 
 class SymbolLookup:
     def __init__(self):
-        self.csv_path = Path(__file__).parent.parent / "bin" / "Final_symbols.csv"
-        self.symbol_data: List[Dict[str, str]] = []
-        self.load_symbols()
+        self.csv_path = SYMBOLS_CSV
+        # Parsed rows pickled next to the CSV, reused while the CSV's (mtime_ns, size) match
+        self.cache_path = self.csv_path.with_suffix(".cache")
+        self.symbol_data: List[SymbolRow] = []
+        # ISIN (upper) -> first row with that ISIN, matching the old first-match scans
+        self._by_isin: Dict[str, SymbolRow] = {}
+        # "NAME\tSYMBOL\n" per row in one string, and where each row's line starts
+        self._search_blob = ""
+        self._search_offsets: List[int] = []
+        # The CSV is read on first lookup, not when the instance is created. Lookups run
+        # on worker threads, so the load is locked and _loaded only flips once it is done
+        self._loaded = False
+        self._load_lock = threading.RLock()
+        # Names repeat (same stock typed again, add after search), so remember recent answers
+        self._find_isin = lru_cache(maxsize=1024)(self._find_isin_uncached)
+    
+    def _ensure_loaded(self):
+        """Load the CSV the first time any lookup needs it"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load_symbols()
     
     def load_symbols(self):
         """Load symbol data from CSV file"""
+        with self._load_lock:
+            symbol_data = self._read_symbols()
+            
+            by_isin = {}
+            for row in symbol_data:
+                by_isin.setdefault(row.isin.upper(), row)
+            
+            # One blob lets search_stocks run str.find (C) instead of a per-row Python loop
+            parts = []
+            offsets = []
+            pos = 0
+            for row in symbol_data:
+                line = f"{_strip_separators(row.name_upper)}\t{_strip_separators(row.symbol_upper)}\n"
+                offsets.append(pos)
+                parts.append(line)
+                pos += len(line)
+            
+            self.symbol_data = symbol_data
+            self._by_isin = by_isin
+            self._search_blob = ''.join(parts)
+            self._search_offsets = offsets
+            self._loaded = True
+            # Drop answers computed against the previous data
+            self._find_isin.cache_clear()
+    
+    def _read_symbols(self) -> List[SymbolRow]:
+        """Parse the symbols CSV, or reuse the pickled rows if the CSV has not changed"""
+        try:
+            st = self.csv_path.stat()
+        except OSError as e:
+            print(f"Error loading symbols CSV: {e}")
+            return []
+        csv_key = (st.st_mtime_ns, st.st_size)
+        
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cached_key, rows = pickle.load(f)
+            if cached_key == csv_key:
+                return rows
+        except Exception:
+            pass  # No usable cache, parse the CSV
+        
         try:
             # Use utf-8-sig to automatically remove BOM if present
-            with open(self.csv_path, 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                self.symbol_data = list(reader)
+            with open(self.csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader, [])
+                # Missing columns point one past the header, at the '' padding below
+                width = len(header) + 1
+                idx = {name: i for i, name in enumerate(header)}
+                i_exch, i_name, i_sym, i_isin = (
+                    idx.get(col, width - 1) for col in ('Exchange', 'Name', 'Trading_symbol', 'isin')
+                )
+                rows = []
+                for row in reader:
+                    if not row:
+                        continue
+                    if len(row) < width:
+                        row += [''] * (width - len(row))
+                    rows.append(_make_row(row[i_exch], row[i_name], row[i_sym], row[i_isin]))
         except Exception as e:
             print(f"Error loading symbols CSV: {e}")
-            self.symbol_data = []
+            return []
+        
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((csv_key, rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not write symbols cache: {e}")
+        
+        return rows
     
     def get_isin_by_name(self, stock_name: str, exchange: str = None) -> Optional[str]:
         """
@@ -35,23 +137,18 @@ class SymbolLookup:
         Returns:
             ISIN code or None if not found
         """
-        stock_name = stock_name.strip().upper()
-        
+        self._ensure_loaded()
+        # Clean exchange name
+        exchange_clean = exchange.replace('_EQ', '').upper() if exchange else None
+        return self._find_isin(stock_name.strip().upper(), exchange_clean)
+    
+    def _find_isin_uncached(self, stock_name: str, exchange_clean: Optional[str]) -> Optional[str]:
+        """First row whose name contains (or symbol equals) stock_name on exchange_clean"""
         for row in self.symbol_data:
-            name = row.get('Name', '').upper()
-            trading_symbol = row.get('Trading_symbol', '').upper()
-            
             # Match by name or trading symbol
-            if stock_name in name or stock_name == trading_symbol:
-                if exchange:
-                    # Clean exchange name
-                    exchange_clean = exchange.replace('_EQ', '').upper()
-                    row_exchange = row.get('Exchange', '').upper()
-                    
-                    if exchange_clean == row_exchange:
-                        return row.get('isin')
-                else:
-                    return row.get('isin')
+            if stock_name in row.name_upper or stock_name == row.symbol_upper:
+                if exchange_clean is None or exchange_clean == row.exchange_upper:
+                    return row.isin
         
         return None
     
@@ -65,13 +162,9 @@ class SymbolLookup:
         Returns:
             Stock name or None if not found
         """
-        isin = isin.strip().upper()
-        
-        for row in self.symbol_data:
-            if row.get('isin', '').upper() == isin:
-                return row.get('Name')
-        
-        return None
+        self._ensure_loaded()
+        row = self._by_isin.get(isin.strip().upper())
+        return row.name if row else None
     
     def get_trading_symbol_by_isin(self, isin: str) -> Optional[str]:
         """
@@ -83,42 +176,56 @@ class SymbolLookup:
         Returns:
             Trading symbol or None if not found
         """
-        isin = isin.strip().upper()
-        
-        for row in self.symbol_data:
-            if row.get('isin', '').upper() == isin:
-                return row.get('Trading_symbol')
-        
-        return None
+        self._ensure_loaded()
+        row = self._by_isin.get(isin.strip().upper())
+        return row.trading_symbol if row else None
     
-    def search_stocks(self, query: str, limit: int = 10) -> List[Dict[str, str]]:
+    def search_stocks(self, query: str, limit: int = 10, exchange: str = None) -> List[Dict[str, str]]:
         """
         Search for stocks by name or trading symbol
         
         Args:
             query: Search query
             limit: Maximum number of results
+            exchange: Optional exchange filter (BSE/NSE, with or without _EQ)
         
         Returns:
             List of matching stocks with their details
         """
+        self._ensure_loaded()
         query = query.strip().upper()
+        exchange_clean = exchange.replace('_EQ', '').upper() if exchange else None
         results = []
         
-        for row in self.symbol_data:
-            name = row.get('Name', '').upper()
-            trading_symbol = row.get('Trading_symbol', '').upper()
+        # The separators never occur inside a field, so such a query cannot match
+        if not self._search_offsets or '\t' in query or '\n' in query:
+            return results
+        
+        blob = self._search_blob
+        offsets = self._search_offsets
+        pos = 0
+        while True:
+            pos = blob.find(query, pos)
+            if pos < 0:
+                break
+            
+            # Map the hit back to its row, then resume at the next row so each row counts once
+            i = bisect_right(offsets, pos) - 1
+            pos = offsets[i + 1] if i + 1 < len(offsets) else len(blob)
+            
+            row = self.symbol_data[i]
+            if exchange_clean and row.exchange_upper != exchange_clean:
+                continue
             
-            if query in name or query in trading_symbol:
-                results.append({
-                    'exchange': row.get('Exchange'),
-                    'name': row.get('Name'),
-                    'trading_symbol': row.get('Trading_symbol'),
-                    'isin': row.get('isin')
-                })
-                
-                if len(results) >= limit:
-                    break
+            results.append({
+                'exchange': row.exchange,
+                'name': row.name,
+                'trading_symbol': row.trading_symbol,
+                'isin': row.isin
+            })
+            
+            if len(results) >= limit:
+                break
         
         return results
     
@@ -149,7 +256,35 @@ class SymbolLookup:
             'name': name or 'Unknown',
             'trading_symbol': trading_symbol or 'Unknown'
         }
-    
+
+    def parse_instrument_keys(self, instrument_keys: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        Parse many instrument keys at once
+
+        Args:
+            instrument_keys: Keys in format "EXCHANGE|ISIN"
+
+        Returns:
+            Dictionary of instrument key -> details, same shape as parse_instrument_key;
+            malformed keys are left out
+        """
+        self._ensure_loaded()
+        result = {}
+        for instrument_key in instrument_keys:
+            parts = instrument_key.split('|')
+            if len(parts) != 2:
+                continue
+            exchange, isin = parts
+            row = self._by_isin.get(isin.strip().upper())
+            result[instrument_key] = {
+                'exchange': exchange,
+                'isin': isin,
+                'name': (row.name if row else None) or 'Unknown',
+                'trading_symbol': (row.trading_symbol if row else None) or 'Unknown'
+            }
+
+        return result
+
     def create_instrument_key(self, stock_name: str, exchange: str) -> Optional[str]:
         """
         Create instrument key from stock name and exchange
@@ -168,6 +303,15 @@ class SymbolLookup:
         
         return None
 
+def _make_row(exchange: str, name: str, trading_symbol: str, isin: str) -> SymbolRow:
+    """Build a SymbolRow, upper-casing the searched fields once at load time"""
+    return SymbolRow(exchange, name, trading_symbol, isin,
+                     exchange.upper(), name.upper(), trading_symbol.upper())
+
+def _strip_separators(field: str) -> str:
+    """Blank out the search blob's separators if a CSV field happens to contain them"""
+    return field.replace('\t', ' ').replace('\n', ' ')
+
 # Global instance
 _lookup = None
 
@@ -2,10 +2,17 @@
 Telegram Alerts Module
 Sends trading signals and alerts to configured Telegram chat IDs
 """
+import hashlib
 import os
 import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from core_logic.logger_config import get_logger
@@ -15,16 +22,68 @@ logger = get_logger()
 
 TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
 
-def send_telegram_alert(text, parse_mode="Markdown"):
+# One keep-alive session for every alert, so each send reuses the TLS connection
+# to api.telegram.org. Flood-limit (429) and gateway errors are retried with
+# backoff; urllib3 honours Telegram's Retry-After header.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=4, pool_maxsize=max(10, len(TELEGRAM_CHAT_IDS) * 2),
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({"POST"}))
+))
+
+# Sends to different chats overlap, so an alert costs one round-trip rather than one per chat
+ALERT_WORKERS = 8
+_executor = ThreadPoolExecutor(max_workers=ALERT_WORKERS, thread_name_prefix="telegram-alert")
+
+# Telegram allows about 30 messages/s per bot; stay under it so bursts queue here instead of 429ing
+ALERT_MAX_RATE = 25
+
+
+class _RateLimiter:
+    """Token bucket shared by the send threads: bursts up to `rate`, then `rate` per second"""
+
+    def __init__(self, rate):
+        self._rate = rate
+        self._tokens = float(rate)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Take one token, sleeping until it is due if the bucket is empty"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._rate, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            # Tokens may go negative: each caller reserves its slot, then sleeps outside the lock
+            self._tokens -= 1
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+
+_limiter = _RateLimiter(ALERT_MAX_RATE)
+
+# An identical alert sent again within this many seconds is dropped (the strategy can
+# re-emit the same signal while price oscillates); at most ALERT_DEDUPE_MAX are remembered
+ALERT_DEDUPE_SECONDS = 30
+ALERT_DEDUPE_MAX = 512
+_recent_alerts = OrderedDict()  # message digest -> monotonic time it was last sent
+_recent_lock = threading.Lock()
+
+def send_telegram_alert(text, parse_mode="Markdown", skip_cache=False):
     """
     Send alert message to all configured Telegram chat IDs
     
     Args:
         text: Message text to send
         parse_mode: Message formatting (Markdown or HTML)
+        skip_cache: Send even if the same text went out in the last ALERT_DEDUPE_SECONDS
     
     Returns:
         bool: True if at least one message was sent successfully
+              (or an identical one was, recently)
     """
     if not TELEGRAM_CHAT_IDS:
         logger.warning("[TELEGRAM] No chat IDs configured. Set TELEGRAM_CHAT_IDS in .env")
@@ -34,28 +93,66 @@ def send_telegram_alert(text, parse_mode="Markdown"):
         logger.warning("[TELEGRAM] Bot token not configured. Set TELEGRAM_BOT_TOKEN in .env")
         return False
     
-    success_count = 0
-    fail_count = 0
-    
-    for chat_id in TELEGRAM_CHAT_IDS:
-        payload = {
-            "chat_id": chat_id,
-            "text": text,
-            "parse_mode": parse_mode
-        }
-        try:
-            r = requests.post(TELEGRAM_API, json=payload, timeout=10)
-            r.raise_for_status()
-            logger.info(f"[TELEGRAM] ✓ Message sent to chat_id: {chat_id}")
-            success_count += 1
-        except Exception as e:
-            logger.error(f"[TELEGRAM] ✗ Failed to send to chat_id {chat_id}: {e}")
-            fail_count += 1
+    digest = hashlib.blake2b(f"{parse_mode}\0{text}".encode(), digest_size=16).digest()
+    if not skip_cache:
+        with _recent_lock:
+            sent_at = _recent_alerts.get(digest)
+        if sent_at is not None and time.monotonic() - sent_at < ALERT_DEDUPE_SECONDS:
+            logger.info("[TELEGRAM] Skipped duplicate alert sent moments ago")
+            return True
+    
+    results = list(_executor.map(
+        lambda chat_id: _send_to_chat(chat_id, text, parse_mode), TELEGRAM_CHAT_IDS
+    ))
+    success_count = sum(results)
+    fail_count = len(results) - success_count
     
     logger.info(f"[TELEGRAM] Summary: {success_count} sent, {fail_count} failed")
+    
+    # Only delivered alerts are remembered, so a failed one can be retried straight away
+    if success_count:
+        with _recent_lock:
+            _recent_alerts[digest] = time.monotonic()
+            _recent_alerts.move_to_end(digest)
+            if len(_recent_alerts) > ALERT_DEDUPE_MAX:
+                _recent_alerts.popitem(last=False)
+    
     return success_count > 0
 
 
+def _send_to_chat(chat_id, text, parse_mode):
+    """Send one message to one chat, returning True on success"""
+    payload = {
+        "chat_id": chat_id,
+        "text": text,
+        "parse_mode": parse_mode
+    }
+    try:
+        _limiter.wait()
+        r = _session.post(TELEGRAM_API, json=payload, timeout=10)
+        r.raise_for_status()
+        logger.info(f"[TELEGRAM] ✓ Message sent to chat_id: {chat_id}")
+        return True
+    except Exception as e:
+        logger.error(f"[TELEGRAM] ✗ Failed to send to chat_id {chat_id}: {e}")
+        return False
+
+
+# Signal message layouts, built once and filled with str.format
+_ENTRY_MESSAGE = (
+    "{emoji} *{signal} SIGNAL* - `{symbol}`\n\n"
+    "📍 Entry Price: `{entry:.2f}`\n"
+    "🛑 Stop Loss: `{sl:.2f}`\n"
+    "🎯 Take Profit: `{tp:.2f}`\n"
+    "📊 Risk/Reward: `{rr:.2f}`\n"
+).format
+_EXIT_MESSAGE = (
+    "{emoji} *EXIT SIGNAL* - `{symbol}`\n\n"
+    "📍 Exit Price: `{exit_price:.2f}`\n"
+    "📝 Reason: `{reason}`\n"
+).format
+
+
 def format_signal_message(symbol, signal_data):
     """
     Format trading signal into a Telegram message
@@ -69,32 +166,25 @@ def format_signal_message(symbol, signal_data):
     """
     signal_type = signal_data.get("signal", "UNKNOWN")
     
-    if signal_type in ["BUY", "SELL"]:
-        entry = signal_data.get("entry_price", 0)
-        sl = signal_data.get("sl", 0)
-        tp = signal_data.get("tp", 0)
-        
-        emoji = "🚀" if signal_type == "BUY" else "💣"
-        
-        message = f"{emoji} *{signal_type} SIGNAL* - `{symbol}`\n\n"
-        message += f"📍 Entry Price: `{entry:.2f}`\n"
-        message += f"🛑 Stop Loss: `{sl:.2f}`\n"
-        message += f"🎯 Take Profit: `{tp:.2f}`\n"
-        message += f"📊 Risk/Reward: `{signal_data.get('rr', 1.6):.2f}`\n"
-        
-        return message
+    if signal_type in ("BUY", "SELL"):
+        return _ENTRY_MESSAGE(
+            emoji="🚀" if signal_type == "BUY" else "💣",
+            signal=signal_type,
+            symbol=symbol,
+            entry=signal_data.get("entry_price", 0),
+            sl=signal_data.get("sl", 0),
+            tp=signal_data.get("tp", 0),
+            rr=signal_data.get("rr", 1.6),
+        )
     
     elif signal_type == "EXIT":
-        exit_price = signal_data.get("exit_price", 0)
         reason = signal_data.get("reason", "UNKNOWN")
-        
-        emoji = "✅" if reason == "TP HIT" else "❌"
-        
-        message = f"{emoji} *EXIT SIGNAL* - `{symbol}`\n\n"
-        message += f"📍 Exit Price: `{exit_price:.2f}`\n"
-        message += f"📝 Reason: `{reason}`\n"
-        
-        return message
+        return _EXIT_MESSAGE(
+            emoji="✅" if reason == "TP HIT" else "❌",
+            symbol=symbol,
+            exit_price=signal_data.get("exit_price", 0),
+            reason=reason,
+        )
     
     else:
         return f"⚠️ *UNKNOWN SIGNAL* - `{symbol}`\n{signal_data}"
@@ -108,10 +198,9 @@ def send_status_update(symbol, status_info):
         symbol: Stock symbol
         status_info: Dictionary with status information
     """
-    message = f"📊 *Status Update* - `{symbol}`\n\n"
-    
-    for key, value in status_info.items():
-        message += f"{key}: `{value}`\n"
+    message = f"📊 *Status Update* - `{symbol}`\n\n" + "".join(
+        f"{key}: `{value}`\n" for key, value in status_info.items()
+    )
     
     return send_telegram_alert(message)
 
@@ -124,4 +213,4 @@ def send_error_alert(error_message):
         error_message: Error description
     """
     message = f"⚠️ *ERROR ALERT*\n\n`{error_message}`"
-    return send_telegram_alert(message)
+    return send_telegram_alert(message, skip_cache=True)
@@ -4,35 +4,67 @@ Handles Upstox token validation and refresh
 """
 import os
 import sys
+import time
 from datetime import datetime
 from pathlib import Path
 
 import requests
+from dotenv import dotenv_values
+from requests.adapters import HTTPAdapter
+
 from core_logic.logger_config import get_logger
+from telegram_bot.env_file import ENV_WRITE_LOCK, replace_env_file
 
 logger = get_logger()
 
+ENV_PATH = Path(__file__).resolve().parent.parent / ".env"
+
+# Seconds a token check result is reused before asking Upstox again
+TOKEN_CHECK_TTL = 60
+
+# Keep-alive session for the Upstox profile and token endpoints
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+
 class TokenManager:
     def __init__(self):
-        self.env_path = Path(__file__).parent.parent / ".env"
+        self.env_path = ENV_PATH
         self.token_check_url = "https://api.upstox.com/v2/user/profile"
+        # (access_token, monotonic time, wall-clock time, (is_valid, message)) of the last check
+        self._validity_cache = None
+        # Parsed .env keyed by (mtime_ns, size) so unchanged files cost one stat
+        self._env_cache = None
+        self._env_stat = None
     
     def read_env(self):
         """Read .env file and return as dictionary"""
-        env_vars = {}
-        if self.env_path.exists():
-            with open(self.env_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        env_vars[key.strip()] = value.strip()
-        return env_vars
+        try:
+            st = self.env_path.stat()
+        except FileNotFoundError:
+            self._env_cache = None
+            self._env_stat = None
+            return {}
+        
+        env_stat = (st.st_mtime_ns, st.st_size)
+        if self._env_cache is not None and env_stat == self._env_stat:
+            return self._env_cache.copy()
+        
+        # Same parser load_dotenv uses, so quoted values match what config.py sees;
+        # bare keys without '=' come back as None and are skipped as before
+        env_vars = {key: value for key, value in dotenv_values(self.env_path).items()
+                    if value is not None}
+        
+        self._env_cache = env_vars
+        self._env_stat = env_stat
+        return env_vars.copy()
     
-    def check_token_validity(self):
+    def check_token_validity(self, force=False):
         """
         Check if current Upstox access token is valid
         
+        Args:
+            force: Skip the TOKEN_CHECK_TTL cache and always ask Upstox
+        
         Returns:
             tuple: (is_valid: bool, message: str)
         """
@@ -42,32 +74,47 @@ class TokenManager:
         if not access_token:
             return False, "No access token found in .env file"
         
-        try:
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Accept': 'application/json'
-            }
-            
-            response = requests.get(self.token_check_url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('status') == 'success':
-                    user_name = data.get('data', {}).get('user_name', 'Unknown')
-                    return True, f"Token valid for user: {user_name}"
-            
-            elif response.status_code == 401:
-                return False, "Token expired or invalid (401 Unauthorized)"
-            
-            else:
-                return False, f"Token check failed with status {response.status_code}"
+        # A refreshed token never matches the cached one, so it is always re-checked
+        cache = self._validity_cache
+        if (not force and cache is not None and cache[0] == access_token
+                and time.monotonic() - cache[1] < TOKEN_CHECK_TTL):
+            return cache[3]
         
+        # Only answers from Upstox are cached; after an error the next call asks again
+        try:
+            result = self._request_token_validity(access_token)
         except requests.exceptions.RequestException as e:
             logger.error(f"Token validation error: {e}")
             return False, f"Network error during token check: {str(e)}"
         except Exception as e:
             logger.error(f"Unexpected error during token validation: {e}")
             return False, f"Error checking token: {str(e)}"
+        
+        self._validity_cache = (access_token, time.monotonic(), datetime.now(), result)
+        return result
+    
+    def _request_token_validity(self, access_token):
+        """Ask the Upstox profile endpoint whether access_token is valid"""
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Accept': 'application/json'
+        }
+        
+        response = _session.get(self.token_check_url, headers=headers, timeout=10)
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('status') == 'success':
+                user_name = data.get('data', {}).get('user_name', 'Unknown')
+                return True, f"Token valid for user: {user_name}"
+        
+        elif response.status_code == 401:
+            return False, "Token expired or invalid (401 Unauthorized)"
+        
+        else:
+            return False, f"Token check failed with status {response.status_code}"
+        
+        return False, "Token check returned an unexpected response"
     
     def get_authorization_url(self):
         """
@@ -118,7 +165,7 @@ class TokenManager:
         }
         
         try:
-            response = requests.post(token_url, data=payload, timeout=10)
+            response = _session.post(token_url, data=payload, timeout=10)
             
             if response.status_code != 200:
                 return False, f"Token exchange failed: {response.text}", None
@@ -140,16 +187,22 @@ class TokenManager:
     
     def update_env_token(self, token):
         """Update UPSTOX_ACCESS_TOKEN in .env file"""
-        lines = []
-        with open(self.env_path, "r") as f:
-            lines = f.readlines()
-
-        with open(self.env_path, "w") as f:
-            for line in lines:
-                if line.startswith("UPSTOX_ACCESS_TOKEN="):
-                    f.write(f"UPSTOX_ACCESS_TOKEN={token}\n")
-                else:
-                    f.write(line)
+        new_line = f"UPSTOX_ACCESS_TOKEN={token}\n"
+        
+        # The bot controller rewrites .env from worker threads too; take the shared lock
+        # so neither writer replaces the file with a copy read before the other's change
+        with ENV_WRITE_LOCK:
+            with open(self.env_path, "r") as f:
+                lines = f.readlines()
+            
+            out = [new_line if line.startswith("UPSTOX_ACCESS_TOKEN=") else line for line in lines]
+            if new_line not in out:
+                if out and not out[-1].endswith("\n"):
+                    out[-1] += "\n"
+                out.append(new_line)
+            
+            # Write a sibling file and swap it in, so a crash never leaves a truncated .env
+            replace_env_file(self.env_path, lambda f: f.write("".join(out)))
         
         logger.info("Access token updated in .env file")
     
@@ -187,12 +240,14 @@ class TokenManager:
         """
         is_valid, message = self.check_token_validity()
         env_vars = self.read_env()
+        has_token = bool(env_vars.get('UPSTOX_ACCESS_TOKEN'))
+        checked_at = self._validity_cache[2] if has_token and self._validity_cache else datetime.now()
         
         return {
             'is_valid': is_valid,
             'message': message,
-            'has_token': bool(env_vars.get('UPSTOX_ACCESS_TOKEN')),
-            'checked_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'has_token': has_token,
+            'checked_at': checked_at.strftime('%Y-%m-%d %H:%M:%S')
         }
 
 # Global instance